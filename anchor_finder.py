@@ -2,6 +2,7 @@ import os
 import codecs
 import random
 import iso8601
+from itertools import islice
 
 from timex import *
 from read_tml import *
@@ -46,32 +47,53 @@ def get_tml_files(directory=tml_dir):
 
 def doc_features(doc_, add_labels=True, timex_window=range(-8,2),
                                         token_window=[-1,1],
-                                        anchored_classifier=None):
+                                        anchored_classifier=None,
+                                        anchored_labels=None):
+    """Return the pairwise features for the timexes of a document. If an
+    anchored classifier is given, or a list of its labels for the timexes
+    (see corpus_features), only the timexes it predicts to be anchored are
+    paired."""
     doc = strip_xml(doc_)
-    pair_features = []
-    timex_features = []
+    features = timex_features(doc, token_window)
+    if anchored_labels is None and anchored_classifier:
+        anchored_labels = classify_many(anchored_classifier, features)
+    return pair_features(doc, features, anchored_labels, add_labels,
+                         timex_window)
+
+def timex_features(doc, token_window=[-1,1]):
+    """Return a feature set for each timex in a document (which should
+    already have been stripped of XML), taken from it and the tokens in the
+    window around it."""
+    feature_sets = []
+    for i in range(len(doc.timexes)):
+        x, y = doc.timexes[i][1]
+        features = token_features(doc.sentences[x][y])
+        for j in token_window:
+            if y+j >= 0 and y+j < len(doc.sentences[x]):
+                 features.update(prefixed_dict(
+                                 token_features(doc.sentences[x][y+j]),
+                                 'token_%d' % j))
+        feature_sets.append(features)
+    return feature_sets
+
+def pair_features(doc, features, anchored_labels=None, add_labels=True,
+                  timex_window=range(-8,2)):
+    """Return the pairwise features for the timexes of a document, given
+    their individual features; timexes labeled UNANCHORED are skipped."""
+    pairs = []
+    kept = []
     timexes = []
-    if anchored_classifier:
-        anchored_feat = anchored_features(doc, False)
     for i in range(len(doc.timexes)):
-        if not (anchored_classifier and \
-                anchored_classifier.classify(anchored_feat[i]) == 'UNANCHORED'):
+        if not (anchored_labels and anchored_labels[i] == 'UNANCHORED'):
             x, y = doc.timexes[i][1]
-            timex = doc.sentences[x][y]
-            timexes.append(timex)
-            these_features = token_features(timex)
-            for j in token_window:
-                if y+j >= 0 and y+j < len(doc.sentences[x]):
-                     these_features.update(prefixed_dict(
-                                           token_features(doc.sentences[x][y+j]),
-                                           'token_%d' % j))
-            timex_features.append(these_features)
-    for i in range(len(timex_features)):
+            timexes.append(doc.sentences[x][y])
+            kept.append(features[i])
+    for i in range(len(kept)):
         for j in timex_window:
             pair = {}
             if i+j >= 0 and i+j < len(timexes) and j != 0:
-                pair = pairwise_features(timex_features[i],
-                                         timex_features[i+j],
+                pair = pairwise_features(kept[i],
+                                         kept[i+j],
                                          j)
                 if add_labels:
                     if anchored(timexes[i]) and \
@@ -80,30 +102,32 @@ def doc_features(doc_, add_labels=True, timex_window=range(-8,2),
                     else: label = 'NOT_AN_ANCHOR'
                     if len(pair) > 0:
                         pair = (pair, label)
-            if len(pair) > 0: pair_features.append(pair)
-    return pair_features
+            if len(pair) > 0: pairs.append(pair)
+    return pairs
 
 def anchored_features(doc_, add_labels=True, token_window=[-1,1]):
     doc = strip_xml(doc_)
-    feature_sets = []
-    for i in range(len(doc.timexes)):
-        x, y = doc.timexes[i][1]
-        timex = doc.sentences[x][y]
-        features = token_features(timex)
-        for j in token_window:
-            if y+j >= 0 and y+j < len(doc.sentences[x]):
-                 features.update(prefixed_dict(
-                                 token_features(doc.sentences[x][y+j]),
-                                 'token_%d' % j))
-        if add_labels:
-            if anchored(timex):
+    feature_sets = timex_features(doc, token_window)
+    if add_labels:
+        for i in range(len(doc.timexes)):
+            x, y = doc.timexes[i][1]
+            if anchored(doc.sentences[x][y]):
                 label = 'ANCHORED'
             else:
                 label = 'UNANCHORED'
-            features = (features, label)
-        feature_sets.append(features)
+            feature_sets[i] = (feature_sets[i], label)
     return feature_sets
 
+def classify_many(classifier, feature_sets):
+    """Classify a list of feature sets in one call, if the classifier
+    supports it (as NLTK classifiers do), or one at a time otherwise."""
+    if not feature_sets:
+        return []
+    elif hasattr(classifier, 'classify_many'):
+        return list(classifier.classify_many(feature_sets))
+    else:
+        return [classifier.classify(features) for features in feature_sets]
+
 def pairwise_features(timex1_features, timex2_features, distance):
     pairwise = {}
     pairwise.update(timex1_features)
@@ -121,15 +145,47 @@ def pairwise_features(timex1_features, timex2_features, distance):
                                       timex2_features['timex_type'])
     return pairwise
 
-def corpus_features(corpus, feature_func=doc_features, restrictor=None):
+def corpus_features(corpus, feature_func=doc_features, restrictor=None,
+                    chunk_size=None):
+    """Return the features for every document in a corpus, as computed by
+    feature_func; if a restrictor (an anchored classifier) is given, it is
+    passed on as the anchored classifier.
+
+    If a chunk size is given, the pairwise features of doc_features are
+    computed instead (feature_func is not used), for that many documents
+    at a time: the timexes of a whole chunk are classified by the
+    restrictor in a single call (see classify_many), and only those
+    predicted to be anchored are paired."""
+    if chunk_size:
+        return chunked_features(corpus, restrictor, chunk_size)
     feature_sets = []
     for doc in corpus:
         if not restrictor:
             feature_sets.extend(feature_func(doc))
         else:
-            feature_sets.extend(feature_func(doc, anchored_classifier=restrictor))
+            feature_sets.extend(feature_func(doc,
+                                             anchored_classifier=restrictor))
     return feature_sets
 
+def chunked_features(corpus, restrictor, chunk_size):
+    feature_sets = []
+    corpus = iter(corpus)
+    while True:
+        chunk = [strip_xml(doc) for doc in islice(corpus, chunk_size)]
+        if not chunk:
+            return feature_sets
+        features = [timex_features(doc) for doc in chunk]
+        if restrictor:
+            labels = classify_many(restrictor, [f for timexes in features
+                                                  for f in timexes])
+        start = 0
+        for doc, timexes in zip(chunk, features):
+            end = start + len(timexes)
+            feature_sets.extend(pair_features(doc, timexes,
+                                              labels[start:end]
+                                              if restrictor else None))
+            start = end
+
 begin_words = ['beginning', 'starting']
 end_words = ['ending']
 after_words = ['after', 'later', 'following']
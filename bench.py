@@ -0,0 +1,375 @@
+"""Benchmarks for the Earley parser and the timex grammar.
+
+Micro-benchmarks time the individual parser operations (prediction,
+scanning, completion), grammar loading and terminal matching on small
+synthetic inputs; macro-benchmarks tag a generated newswire-like corpus
+and the phrases from run.py with the full timex grammar. Each benchmark
+runs in a fresh child process, so that its peak memory can be measured
+in isolation.
+
+Usage:
+
+    python bench.py [--repeat N] [--save FILE] [--compare FILE] [NAME ...]
+
+With --save, the results are written to FILE as JSON; with --compare,
+they are compared against such a baseline, and the exit status is nonzero
+if any benchmark is slower by more than the given tolerance."""
+
+import argparse
+import gc
+import json
+import multiprocessing
+import random
+import resource
+import sys
+import time
+
+from cfg import *
+from earley import Parser, ParseTables, State
+
+# Timing.
+
+def best_time(func, repeat):
+    """Call func repeat times, and return the best wall-clock time."""
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def chart_size(parser):
+    return sum(len(column) for column in parser.chart)
+
+# A generated corpus of newswire-like sentences.
+
+subjects = ["the company", "the president", "officials", "analysts",
+            "the Commerce Department", "the bank", "Mr. Smith",
+            "the committee", "investors", "the union"]
+verbs = ["said", "reported", "announced", "expected", "estimated",
+         "predicted", "denied", "confirmed"]
+objects = ["a loss", "higher earnings", "the merger", "an agreement",
+           "new rules", "a decline in sales", "the results",
+           "a 5 % increase"]
+timexes = ["today", "yesterday", "last week", "next month", "this year",
+           "two years ago", "the past 18 months", "the third quarter",
+           "April 29th", "April 29th 2000", "29 April", "Sunday",
+           "March 3 , 1998", "the first quarter of 1999", "three days later",
+           "about two weeks", "early 1990", "the coming year", "recently",
+           "now", "earlier this month", "nineteen ninety-nine",
+           "the next two years or so", "at least the past 18 months"]
+
+def generate_corpus(sentences=200, seed=1776):
+    """Return a list of tokenized sentences. The corpus is generated from
+    a fixed seed, so it is the same every time."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(sentences):
+        words = [rng.choice(subjects), rng.choice(verbs), rng.choice(objects)]
+        for j in range(rng.randint(0, 2)):
+            words.insert(rng.randint(0, len(words)), rng.choice(timexes))
+        if rng.random() < 0.3:
+            words.append("for %s" % rng.choice(timexes))
+        corpus.append(" ".join(words).split() + ["."])
+    return corpus
+
+# Synthetic grammars for the micro-benchmarks.
+
+def wide_grammar(n):
+    """A grammar with n alternatives for its start symbol, each of which
+    predicts one more nonterminal."""
+    rules = []
+    for i in range(n):
+        rules.append(Production("S", ["A%d" % i, Literal("x")]))
+        rules.append(Production("A%d" % i, [Literal("a%d" % i)]))
+    return Grammar(rules)
+
+def right_recursive_grammar():
+    return Grammar([Production("S", ["L"]),
+                    Production("L", [Literal("x"), "L"]),
+                    Production("L", [Literal("x")])])
+
+def grammar_spec(n):
+    """Return a generated grammar specification with 2n productions."""
+    return "".join("r%d -> r%d \"a%d\" \"b\" { _[0] }\n"
+                   "    | \"c\" \"d\" \"e\" { %d }\n" % (i, i+1, i, i)
+                   for i in range(n)) + "r%d -> \"z\"\n" % n
+
+# Benchmarks. Each takes the number of repetitions, and returns a dictionary
+# of measurements; "seconds" is required, and "tokens" and "chart" are used
+# if present.
+
+benchmarks = []
+
+def benchmark(func):
+    benchmarks.append(func)
+    return func
+
+@benchmark
+def predict(repeat, n=2000):
+    grammar = wide_grammar(100)
+    parser = Parser(grammar)
+    state = State(Production(parser.start, grammar.start), 0)
+    def run():
+        for i in range(n):
+            parser.chart = [[state]]
+            parser.cache = [set()]
+            parser.predict(state, 0)
+    return {"seconds": best_time(run, repeat), "chart": chart_size(parser)}
+
+@benchmark
+def scan(repeat, n=20000):
+    parser = Parser(Grammar([Production("S", [Literal("x")])]))
+    state = State(parser.grammar["S"][0], 0)
+    def run():
+        for i in range(n):
+            parser.chart = [[state]]
+            parser.cache = [set()]
+            parser.scan(state, 0, "x")
+    return {"seconds": best_time(run, repeat), "tokens": n}
+
+@benchmark
+def complete(repeat, n=200, waiting=100):
+    rules = [Production("W%d" % i, ["X", Literal("y")])
+             for i in range(waiting)]
+    done = State(Production("X", [Literal("x")]), 0, 1, ["x"])
+    parser = Parser(Grammar(rules))
+    def run():
+        for i in range(n):
+            parser.chart = [[State(rule, 0) for rule in rules], [done]]
+            parser.cache = [set(), set()]
+            parser.complete(done, 1)
+    return {"seconds": best_time(run, repeat), "chart": chart_size(parser)}
+
+@benchmark
+def parse_wide(repeat, n=200):
+    grammar = wide_grammar(100)
+    def run():
+        for i in range(n):
+            Parser(grammar).parse(["a99", "x"])
+    parser = Parser(grammar)
+    parser.parse(["a99", "x"])
+    return {"seconds": best_time(run, repeat), "tokens": 2 * n,
+            "chart": chart_size(parser)}
+
+@benchmark
+def parse_right_recursive(repeat, leo=False, n=300):
+    grammar = right_recursive_grammar()
+    parser = Parser(grammar, leo=leo)
+    def run():
+        parser.parse("x" * n)
+    return {"seconds": best_time(run, repeat), "tokens": n,
+            "chart": chart_size(parser)}
+
+@benchmark
+def parse_right_recursive_leo(repeat):
+    return parse_right_recursive(repeat, leo=True)
+
+@benchmark
+def load_grammar_spec(repeat, leo=False, n=200):
+    from grammarparser import grammar_spec_grammar, parse_grammar_spec
+    spec = grammar_spec(n)
+    parser = Parser(grammar_spec_grammar, leo=leo)
+    def run():
+        parse_grammar_spec(spec, "r0", parser=parser)
+    return {"seconds": best_time(run, repeat), "chart": chart_size(parser)}
+
+@benchmark
+def load_grammar_spec_leo(repeat):
+    return load_grammar_spec(repeat, leo=True)
+
+@benchmark
+def load_grammar_spec_rd(repeat, n=200):
+    from grammarparser import load_grammar_spec
+    spec = grammar_spec(n)
+    return {"seconds": best_time(lambda: load_grammar_spec(spec, "r0"),
+                                 repeat)}
+
+@benchmark
+def match_terminals(repeat, n=2000):
+    terminals = [Literal("january"), RegexpTerminal(r"[0-9]{1,2}$"),
+                 RegexpTerminal(r"(19|20)\d{2}$"), Abbrev("september", 3),
+                 Acronym("a.m.")]
+    tokens = ["January", "12", "1999", "Sept.", "am", "the", "of"]
+    def run():
+        for i in range(n):
+            for terminal in terminals:
+                for token in tokens:
+                    terminal.match(token)
+    return {"seconds": best_time(run, repeat),
+            "tokens": n * len(terminals) * len(tokens)}
+
+@benchmark
+def load_timex_grammar(repeat):
+    import timex
+    return {"seconds": best_time(timex.read_timex_grammar, repeat)}
+
+@benchmark
+def parse_timex_sentences(repeat):
+    import timex
+    corpus = generate_corpus(50)
+    grammar = timex.read_timex_grammar()
+    sizes = []
+    def run():
+        del sizes[:]
+        for sentence in corpus:
+            parser = Parser(grammar)
+            parser.parse(sentence)
+            sizes.append(chart_size(parser))
+    return {"seconds": best_time(run, repeat),
+            "tokens": sum(len(sentence) for sentence in corpus),
+            "chart": sum(sizes)}
+
+@benchmark
+def tag_corpus(repeat):
+    import timex
+    corpus = generate_corpus()
+    def run():
+        for sentence in corpus:
+            for x in timex.parse(sentence): pass
+    return {"seconds": best_time(run, repeat),
+            "tokens": sum(len(sentence) for sentence in corpus)}
+
+@benchmark
+def tag_corpus_tables(repeat):
+    import timex
+    corpus = generate_corpus()
+    grammar = timex.read_timex_grammar()
+    tables = ParseTables(grammar)
+    def run():
+        for sentence in corpus:
+            for x in timex.parse(sentence, grammar, tables): pass
+    return {"seconds": best_time(run, repeat),
+            "tokens": sum(len(sentence) for sentence in corpus)}
+
+@benchmark
+def tag_corpus_fused(repeat):
+    import timex
+    corpus = generate_corpus()
+    def run():
+        for sentence in corpus:
+            for x in timex.parse(sentence, fused=True): pass
+    return {"seconds": best_time(run, repeat),
+            "tokens": sum(len(sentence) for sentence in corpus)}
+
+@benchmark
+def tag_run_phrases(repeat):
+    import timex
+    from run import phrases
+    def run():
+        for phrase in phrases:
+            for x in timex.parse(phrase.split()): pass
+    return {"seconds": best_time(run, repeat),
+            "tokens": sum(len(phrase.split()) for phrase in phrases)}
+
+def serialize(repeat, encode, decode):
+    import timex
+    tagged = [list(timex.parse(sentence)) for sentence in generate_corpus()]
+    size = []
+    def run():
+        data = [encode(sentence) for sentence in tagged]
+        for x in data:
+            decode(x)
+        size[:] = [sum(len(x) for x in data)]
+    return {"seconds": best_time(run, repeat),
+            "tokens": sum(len(sentence) for sentence in tagged),
+            "bytes": size[0]}
+
+@benchmark
+def serialize_pickle(repeat):
+    import cPickle
+    return serialize(repeat, lambda x: cPickle.dumps(x, 2), cPickle.loads)
+
+@benchmark
+def serialize_wire(repeat):
+    import wire
+    return serialize(repeat, wire.encode, wire.decode)
+
+# Running benchmarks.
+
+def run_isolated(bench, repeat, conn):
+    try:
+        result = bench(repeat)
+        # On Linux, ru_maxrss is in kilobytes.
+        result["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception as e:
+        result = {"error": "%s: %s" % (type(e).__name__, e)}
+    conn.send(result)
+    conn.close()
+
+def run_benchmark(bench, repeat):
+    """Run a benchmark in a child process, and return its results."""
+    parent_conn, child_conn = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target=run_isolated,
+                                      args=(bench, repeat, child_conn))
+    process.start()
+    result = parent_conn.recv()
+    process.join()
+    return result
+
+def report(name, result, baseline=None, tolerance=0.1):
+    """Print a line of results, and return true if the benchmark is slower
+    than the baseline by more than the given tolerance."""
+    if "error" in result:
+        print "%-24s %s" % (name, result["error"])
+        return False
+    line = "%-24s %9.4fs" % (name, result["seconds"])
+    if result.get("tokens"):
+        line += " %10.0f tok/s" % (result["tokens"] / result["seconds"])
+    else:
+        line += " %16s" % ""
+    if result.get("chart"):
+        line += " %8d states" % result["chart"]
+    else:
+        line += " %15s" % ""
+    line += " %7d KB" % result["peak_rss"]
+    if result.get("bytes"):
+        line += " %9d bytes" % result["bytes"]
+    regressed = False
+    if baseline and name in baseline and "seconds" in baseline[name]:
+        ratio = result["seconds"] / baseline[name]["seconds"]
+        regressed = ratio > 1 + tolerance
+        line += "  %5.2fx%s" % (ratio, " REGRESSION" if regressed else "")
+    print line
+    return regressed
+
+def main(names=None, repeat=3, save=None, compare=None, tolerance=0.1):
+    baseline = None
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+    results = {}
+    regressions = []
+    for bench in benchmarks:
+        name = bench.__name__
+        if names and name not in names:
+            continue
+        results[name] = run_benchmark(bench, repeat)
+        if report(name, results[name], baseline, tolerance):
+            regressions.append(name)
+    if save:
+        with open(save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return regressions
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    argparser.add_argument("names", nargs="*", metavar="NAME",
+                           help="benchmarks to run (default: all)")
+    argparser.add_argument("--repeat", type=int, default=3,
+                           help="repetitions per benchmark; the best time "
+                                "is reported")
+    argparser.add_argument("--save", metavar="FILE",
+                           help="save the results as a baseline")
+    argparser.add_argument("--compare", metavar="FILE",
+                           help="compare the results against a baseline")
+    argparser.add_argument("--tolerance", type=float, default=0.1,
+                           help="allowed slowdown relative to the baseline "
+                                "(default: 0.1, i.e., 10%%)")
+    args = argparser.parse_args()
+    sys.exit(1 if main(args.names, args.repeat, args.save, args.compare,
+                       args.tolerance)
+             else 0)
@@ -57,6 +57,9 @@ class Acronym(Terminal):
     def match(self, token):
         return token in self.acronym
 
+    def __str__(self):
+        return self.acronym[0]
+
 class Abbrev(Terminal):
     def __init__(self, string, min_prefix_len):
         assert (isinstance(string, basestring) and
@@ -71,6 +74,9 @@ class Abbrev(Terminal):
         return (len(string) >= self.min and
                 self.string.startswith(string.rstrip(".")))
 
+    def __str__(self):
+        return "%s." % self.string[:self.min]
+
 class Production(object):
     """A production rule consists of a left-hand side (LHS) and a
     right-hand side (RHS). A context-free production will have a single
@@ -106,20 +112,143 @@ class Production(object):
 
 class Grammar(object):
     """A grammar is a collection of production rules and a designated start
-    symbol. The list of productions is stored in a dictionary indexed by LHS."""
+    symbol. The list of productions is stored in a dictionary indexed by LHS.
+
+    Productions may be added to or removed from a grammar after it has been
+    built. Each production's id is its index in the rules list; ids are
+    never reused, and a removed production leaves None in its place."""
 
     def __init__(self, productions, start="S"):
         self.start = start
         self.productions = {}
+        self.rules = [] # all of the productions, in order
+        self.null_rules = None # computed on demand; see nullable()
+        self.yields = None # likewise; see longest_yield()
         for rule in productions:
-            if rule.lhs in self.productions:
-                self.productions[rule.lhs].append(rule)
-            else:
-                self.productions[rule.lhs] = [rule]
+            self.add_production(rule)
 
     def __getitem__(self, lhs):
         return self.productions[lhs]
 
+    def add_production(self, rule):
+        """Add a production to the grammar, and return its id."""
+        self.rules.append(rule)
+        if rule.lhs in self.productions:
+            self.productions[rule.lhs].append(rule)
+        else:
+            self.productions[rule.lhs] = [rule]
+        if self.null_rules is not None and \
+           rule.lhs not in self.null_rules and \
+           all(x in self.null_rules for x in rule.rhs):
+            self.null_rules = self.find_nullable(dict(self.null_rules))
+        self.yields = None
+        return len(self.rules) - 1
+
+    def remove_production(self, rule):
+        """Remove a production (the very object, not an equal one) from the
+        grammar, and return its id. Its LHS stays in the grammar, even if
+        it has no productions left."""
+        for id, x in enumerate(self.rules):
+            if x is rule:
+                break
+        else:
+            raise ValueError("production not in grammar: %r" % rule)
+        self.rules[id] = None
+        rules = self.productions[rule.lhs]
+        del rules[[i for i, x in enumerate(rules) if x is rule][0]]
+        if self.null_rules is not None and rule.lhs in self.null_rules:
+            self.null_rules = None # may have shrunk; recompute on demand
+        self.yields = None
+        return id
+
+    def nullable(self):
+        """Return a dictionary whose keys are the nonterminals that can derive
+        the empty string. The value for each is a production whose RHS
+        consists only of nullable nonterminals that were found before it, so
+        that following those productions always yields a finite derivation
+        of the empty string. The result is cached."""
+        if self.null_rules is None:
+            self.null_rules = self.find_nullable({})
+        return self.null_rules
+
+    def find_nullable(self, nullable):
+        """Extend a dictionary of nullable nonterminals (see nullable) with
+        all of the others, and return it."""
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.rules:
+                if rule is not None and rule.lhs not in nullable and \
+                   all(x in nullable for x in rule.rhs):
+                    nullable[rule.lhs] = rule
+                    changed = True
+        return nullable
+
+    def longest_yield(self, symbol=None):
+        """Return the greatest number of tokens that a nonterminal (by
+        default, the start symbol) can derive without recursion: only those
+        productions whose RHS doesn't lead back to their LHS are considered.
+        Nonterminals with no such productions derive no tokens. The results
+        for all of the nonterminals are computed together, and cached."""
+        if self.yields is None:
+            self.yields = {}
+            for component in self.components():
+                for lhs in component:
+                    self.yields[lhs] = max([0] + [
+                        sum(1 if isinstance(x, Terminal)
+                            else self.yields.get(x, 0)
+                            for x in rule.rhs)
+                        for rule in self.productions.get(lhs, ())
+                        if not any(x in component for x in rule.rhs)])
+        return self.yields.get(self.start if symbol is None else symbol, 0)
+
+    def components(self):
+        """Return a list of the strongly connected components of the graph
+        whose nodes are the nonterminals, with an edge from each LHS to the
+        nonterminals on its RHS, each as a set. Every component comes after
+        all of those that are reachable from it (Tarjan's algorithm)."""
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        components = []
+        def successors(lhs):
+            return iter([x for rule in self.productions.get(lhs, ())
+                         for x in rule.rhs if not isinstance(x, Terminal)])
+        for root in self.productions:
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, successors(root))]
+            while work:
+                lhs, edges = work[-1]
+                for x in edges:
+                    if x not in index:
+                        index[x] = lowlink[x] = len(index)
+                        stack.append(x)
+                        on_stack.add(x)
+                        work.append((x, successors(x)))
+                        break
+                    elif x in on_stack:
+                        lowlink[lhs] = min(lowlink[lhs], index[x])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[lhs])
+                    if lowlink[lhs] == index[lhs]:
+                        component = set()
+                        while True:
+                            x = stack.pop()
+                            on_stack.discard(x)
+                            component.add(x)
+                            if x == lhs:
+                                break
+                        components.append(component)
+        return components
+
 def default_action(rhs):
     return rhs[0]
 
@@ -140,6 +269,17 @@ class AttributeGrammar(Grammar):
                 raise ValueError("Invalid production/action pair: %s" % x)
         super(AttributeGrammar, self).__init__(productions, start)
 
+    def add_production(self, rule, action=None):
+        if action:
+            assert isinstance(action, FunctionType), "invalid action"
+            self.actions[rule] = action
+        return super(AttributeGrammar, self).add_production(rule)
+
+    def remove_production(self, rule):
+        id = super(AttributeGrammar, self).remove_production(rule)
+        self.actions.pop(rule, None)
+        return id
+
     def action(self, production):
         return self.actions.get(production, default_action)
 
@@ -150,9 +290,15 @@ class AttributeGrammar(Grammar):
             return parse
 
 class ParseTree(object):
+    """A node of a parse tree. Trees built by a parser (see State.parse_tree)
+    also record the span of input tokens that each node covers, from start
+    (inclusive) to end (exclusive)."""
+
+    start = end = None
+
     def __init__(self, node, children=None):
         self.node = node
-        self.children = list(children) if children else None
+        self.children = list(children) if children is not None else None
 
     def leaves(self):
         """Yield the leaves of the parse tree, in order."""
@@ -3,8 +3,10 @@
 
 __author__ = "Alex Plotnick <plotnick@cs.brandeis.edu>"
 
+import heapq
 import itertools
 import sys
+import time
 
 from cfg import Terminal, Production, ParseTree
 
@@ -21,11 +23,24 @@ class State(object):
         assert not self.complete, "can't advance a complete state"
         return State(self.rule, self.start, self.dot+1, self.matched + [match])
 
-    def parse_tree(self, tree_class=ParseTree):
-        return tree_class(self.rule,
-                          [x.parse_tree(tree_class) if isinstance(x, State) \
-                                                    else x
-                           for x in self.matched])
+    def parse_tree(self, tree_class=ParseTree, end=None):
+        """Build a parse tree for the state. If the position at which the
+        state ends is given, every node of the tree gets start and end
+        attributes giving the span of input tokens that it covers."""
+        tree_end = end
+        children = []
+        for x in reversed(self.matched):
+            if isinstance(x, State):
+                children.append(x.parse_tree(tree_class, end))
+                end = x.start
+            else:
+                children.append(x)
+                end = end - 1 if end is not None else None
+        children.reverse()
+        tree = tree_class(self.rule, children)
+        if tree_end is not None:
+            tree.start, tree.end = self.start, tree_end
+        return tree
 
     def __eq__(self, other):
         return (self.rule == other.rule and
@@ -52,8 +67,131 @@ class State(object):
     if sys.version_info > (3, 0):
         __str__ = __unicode__
 
+class LeoState(State):
+    """A complete state at the bottom of a deterministic reduction path
+    (see Parser.leo_item). Only the topmost state on such a path is added
+    to the chart; the ones below it are built from the path on demand, the
+    first time any of their attributes are needed."""
+
+    def __init__(self, item, state):
+        self.item = item
+        self.state = state
+
+    def __getattr__(self, name):
+        # Only called for attributes we don't have, i.e., before we've
+        # built the state.
+        if name.startswith("__") or "item" not in self.__dict__:
+            raise AttributeError(name)
+        item, state = self.__dict__.pop("item"), self.__dict__.pop("state")
+        while item.above is not None:
+            state = item.state.advance(state)
+            item = item.above
+        self.__dict__.update(state.__dict__)
+        return getattr(self, name)
+
+class LeoItem(object):
+    """A transitive item: a link in a deterministic reduction path."""
+
+    def __init__(self, state, above):
+        self.state = state # the unique penultimate state
+        self.above = above # the next item up the path, or None
+        self.top = above.top if above else state
+
+class ParseTables(object):
+    """Precomputed prediction tables for a fixed grammar.
+
+    For each nonterminal, we compute its prediction closure: every
+    nonterminal that may begin one of its derivations (looking past any
+    nullable prefix), in the order in which the parser would predict them,
+    together with the ids of their productions (i.e., their indices in
+    grammar.rules). Since the tables contain only nonterminals and integers,
+    they may be pickled and shared with other processes that have built
+    the same grammar."""
+
+    def __init__(self, grammar):
+        self.closures = {}
+        self.compute(grammar, grammar.productions)
+
+    def compute(self, grammar, nonterminals):
+        """(Re)compute the closures of the given nonterminals."""
+        self.size = len(grammar.rules)
+        self.nullable = frozenset(grammar.nullable())
+        ids = dict((rule, i) for i, rule in enumerate(grammar.rules)
+                   if rule is not None)
+        for lhs in nonterminals:
+            closure = self.closure(grammar, lhs)
+            self.closures[lhs] = (tuple(closure),
+                                  tuple(ids[rule]
+                                        for x in closure
+                                        for rule in grammar[x]))
+        self.bound = None
+
+    def update(self, grammar, rules):
+        """Update the tables after the given productions have been added to
+        or removed from the grammar. Only the closures that include the
+        LHS of one of those productions are recomputed, unless the set of
+        nullable nonterminals has changed. Parsers that were created with
+        the old tables must be replaced."""
+        if frozenset(grammar.nullable()) != self.nullable:
+            self.compute(grammar, grammar.productions)
+        else:
+            changed = set(rule.lhs for rule in rules)
+            self.compute(grammar,
+                         [lhs for lhs in grammar.productions
+                          if lhs not in self.closures or
+                             changed.intersection(self.closures[lhs][0])])
+
+    def closure(self, grammar, lhs):
+        nonterminals = [lhs]
+        seen = set(nonterminals)
+        for x in nonterminals: # nonterminals grows as we go
+            for rule in grammar[x]:
+                for symbol in rule.rhs:
+                    if isinstance(symbol, Terminal):
+                        break
+                    if symbol not in seen and symbol in grammar.productions:
+                        seen.add(symbol)
+                        nonterminals.append(symbol)
+                    if symbol not in self.nullable:
+                        break
+        return nonterminals
+
+    def bind(self, grammar):
+        """Return the closures for the given grammar, as a dictionary mapping
+        each nonterminal to a pair of tuples (nonterminals, productions)."""
+        if self.bound is None or self.bound[0] is not grammar:
+            assert len(grammar.rules) == self.size, \
+                "Parse tables don't match the grammar."
+            rules = grammar.rules
+            self.bound = (grammar,
+                          dict((lhs, (nonterminals,
+                                      tuple(rules[id] for id in ids)))
+                               for lhs, (nonterminals, ids) \
+                                   in self.closures.items()))
+        return self.bound[1]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["bound"] = None
+        return state
+
 class Parser(object):
-    """An Earley parser for a given context-free grammar."""
+    """An Earley parser for a given context-free grammar. If parse tables
+    for the grammar are supplied, prediction adds whole precomputed
+    closures at once. If leo is true, completion follows deterministic
+    reduction paths as described by Joop Leo in "A general context-free
+    parsing algorithm running in linear time on every LR(k) grammar
+    without using lookahead" (1991), so that right-recursive rules take
+    linear rather than quadratic time and space. The same parses are
+    found, but not necessarily in the same order, so for an ambiguous
+    grammar, the first one may differ.
+
+    Empty productions are handled as described by Aycock and Horspool in
+    "Practical Earley Parsing" (2002): when the predictor encounters a
+    state that is waiting for a nullable nonterminal, it immediately adds
+    a copy of that state advanced over an empty derivation of it. The
+    completer then never needs to look at empty derivations, whose start
+    column is still under construction when they complete."""
 
     class StartSymbol(object):
         """We'll need a new start rule for the initial state set; using a
@@ -61,9 +199,13 @@ class Parser(object):
         a conflict with an existing grammar."""
         def __str__(self): return "$"
 
-    def __init__(self, grammar):
+    def __init__(self, grammar, tables=None, leo=False):
         self.grammar = grammar
         self.start = self.StartSymbol()
+        self.tables = tables
+        self.leo = leo
+        self.closures = tables.bind(grammar) if tables else None
+        self.nullable = grammar.nullable()
 
     def __getitem__(self, i):
         try:
@@ -79,38 +221,189 @@ class Parser(object):
         return len(self.chart)
 
     def complete(self, state, i):
+        if state.start == i:
+            return # an empty derivation; see predict
+        if self.leo:
+            item = self.leo_item(state.start, state.rule.lhs)
+            if item:
+                # Skip straight to the top of the reduction path.
+                if item.above:
+                    state = LeoState(item, state)
+                self.chart[i].append(item.top.advance(state))
+                return
         for prev in self[state.start][:]:
             if not prev.complete and prev.next == state.rule.lhs:
                 self.chart[i].append(prev.advance(state))
 
+    def leo_item(self, j, symbol):
+        """Return the transitive item for symbol in column j, or None.
+
+        If column j contains exactly one state waiting for symbol, and that
+        state needs only symbol to complete, then completing symbol from j
+        can only complete that state, and so on up. The item records the
+        topmost state on this deterministic reduction path; the items are
+        memoized, so following a path costs constant amortized time."""
+        path = []
+        while (j, symbol) not in self.leo_items:
+            waiting = None
+            for prev in self.chart[j]:
+                if not prev.complete and prev.next == symbol:
+                    if waiting is not None:
+                        waiting = None
+                        break
+                    waiting = prev
+            if waiting and waiting.dot != len(waiting.rule.rhs) - 1:
+                waiting = None
+            path.append((j, symbol, waiting))
+            if waiting is None:
+                break
+            j, symbol = waiting.start, waiting.rule.lhs
+        item = self.leo_items.get((j, symbol))
+        for j, symbol, waiting in reversed(path):
+            item = LeoItem(waiting, item) if waiting else None
+            self.leo_items[(j, symbol)] = item
+        return item
+
     def predict(self, state, i):
-        for rule in self.grammar[state.next]:
-            if rule not in self.cache[i]:
-                self.chart[i].append(State(rule, i, 0))
-                self.cache[i].add(rule)
+        if self.closures is not None:
+            self.predict_closure(state, i)
+        else:
+            for rule in self.grammar[state.next]:
+                if rule not in self.cache[i]:
+                    self.chart[i].append(State(rule, i, 0))
+                    self.cache[i].add(rule)
+        if state.next in self.nullable:
+            self.chart[i].append(state.advance(self.null_state(state.next, i)))
+
+    def null_state(self, lhs, i):
+        """Return a complete state for an empty derivation of lhs at i."""
+        rule = self.nullable[lhs]
+        return State(rule, i, len(rule.rhs),
+                     [self.null_state(x, i) for x in rule.rhs])
+
+    def predict_closure(self, state, i):
+        # With parse tables, the cache holds the nonterminals that have
+        # already been predicted, rather than individual rules.
+        predicted = self.cache[i]
+        if state.next in predicted:
+            return
+        nonterminals, rules = self.closures[state.next]
+        if not predicted:
+            predicted.update(nonterminals)
+            self.chart[i].extend([State(rule, i, 0) for rule in rules])
+        else:
+            for x in nonterminals:
+                if x not in predicted:
+                    predicted.add(x)
+                    self.chart[i].extend([State(rule, i, 0)
+                                          for rule in self.grammar[x]])
 
     def scan(self, state, i, token):
         if state.next.match(token):
             self[i+1] # touch and maybe extend
             self.chart[i+1].append(state.advance(token))
 
-    def parse(self, input):
+    # The counters kept in a statistics dictionary; see parse.
+    counters = ("parses", "tokens", "truncated",
+                "predict_calls", "predicted", "predict_time",
+                "complete_calls", "completions_attempted", "completed",
+                "complete_time",
+                "scan_calls", "scanned", "scan_time")
+
+    def parse(self, input, stats=None, deadline=None, max_states=None):
+        """Parse the input, a sequence of tokens.
+
+        If stats is a dictionary, counts and timings for this parse are
+        added to it: the number of calls to each of the predictor, completer
+        and scanner (every scan is one terminal match), the number of states
+        each of them created, the time spent in each, the number of states
+        examined by the completer, and the size of each chart column. The
+        same dictionary may be passed to several parses to accumulate their
+        statistics. Without it, the parser runs uninstrumented.
+
+        The parse may also be given a budget: a deadline (as a time.time()
+        value) and a maximum number of states in the chart. Both are checked
+        after each column is complete; if either is exceeded, the parse
+        stops there, as though the input ended after the last token read,
+        so that parses of the input up to that point are still available.
+        The number of the last column is then stored in the attribute
+        truncated (which is otherwise None), and counted in stats."""
         self.chart = [[State(Production(self.start, self.grammar.start), 0)]]
         self.cache = [set()]
+        self.leo_items = {}
+        self.stats = stats
+        self.truncated = None
+        budget = deadline is not None or max_states is not None
+        states = 0
+        if stats is None:
+            complete, predict, scan = self.complete, self.predict, self.scan
+        else:
+            complete, predict, scan = self.instrument(stats)
 
         # We have n+1 state sets to process, so we tack on an extra dummy
         # token to the input.
         for i, token in enumerate(itertools.chain(input, [None])):
             for state in self[i]:
                 if state.complete:
-                    self.complete(state, i)
+                    complete(state, i)
                 elif isinstance(state.next, Terminal):
-                    self.scan(state, i, token)
+                    scan(state, i, token)
                 else:
-                    self.predict(state, i)
+                    predict(state, i)
+            if budget and token is not None:
+                states += len(self.chart[i])
+                if (max_states is not None and states > max_states) or \
+                   (deadline is not None and time.time() > deadline):
+                    self.truncated = i
+                    del self.chart[i+1:], self.cache[i+1:]
+                    break
 
-    def parses(self, tree_class=ParseTree):
-        """Yield the completed parse trees."""
+        if stats is not None:
+            if self.truncated is not None:
+                stats["truncated"] += 1
+            stats["parses"] += 1
+            stats["tokens"] += len(self) - 1
+            stats["columns"].extend(len(column) for column in self.chart)
+
+    def instrument(self, stats):
+        """Return instrumented versions of the completer, predictor and
+        scanner that record their work in the given dictionary."""
+        for key in self.counters:
+            stats.setdefault(key, 0)
+        stats.setdefault("columns", [])
+
+        def complete(state, i):
+            before = len(self.chart[i])
+            stats["completions_attempted"] += len(self.chart[state.start])
+            start = time.time()
+            self.complete(state, i)
+            stats["complete_time"] += time.time() - start
+            stats["complete_calls"] += 1
+            stats["completed"] += len(self.chart[i]) - before
+
+        def predict(state, i):
+            before = len(self.chart[i])
+            start = time.time()
+            self.predict(state, i)
+            stats["predict_time"] += time.time() - start
+            stats["predict_calls"] += 1
+            stats["predicted"] += len(self.chart[i]) - before
+
+        def scan(state, i, token):
+            before = len(self.chart[i+1]) if i+1 < len(self.chart) else 0
+            start = time.time()
+            self.scan(state, i, token)
+            stats["scan_time"] += time.time() - start
+            stats["scan_calls"] += 1
+            if i+1 < len(self.chart):
+                stats["scanned"] += len(self.chart[i+1]) - before
+
+        return complete, predict, scan
+
+    def final_states(self):
+        """Yield pairs (i, state), where state is a complete state for the
+        grammar's start symbol that spans the first i tokens of the input,
+        in the same order as parses yields their trees."""
         for i in reversed(range(len(self))):
             for state in self[i]:
                 if state.rule.lhs is self.start and \
@@ -118,7 +411,58 @@ class Parser(object):
                    state.start == 0:
                     # We skip the inserted start rule by grabbing the first
                     # child matched in the start state.
-                    yield state.matched[0].parse_tree(tree_class)
+                    yield i, state.matched[0]
+
+    def parses(self, tree_class=ParseTree):
+        """Yield the completed parse trees."""
+        for i, state in self.final_states():
+            yield state.parse_tree(tree_class, i)
+
+    def best_states(self, k=None, score=None):
+        """Like final_states, but yield at most k pairs (or all of them, if
+        k is None), in order of increasing score (see longest_span), with
+        ties broken by the order of final_states. Every final state is
+        scored, but the scorers share work through a memo table, and only
+        the pairs actually requested are sorted."""
+        score = score or longest_span
+        memo = {}
+        heap = [(score(i, state, memo), n, i, state)
+                for n, (i, state) in enumerate(self.final_states())]
+        heapq.heapify(heap)
+        while heap and (k is None or k > 0):
+            _, _, i, state = heapq.heappop(heap)
+            yield i, state
+            if k is not None:
+                k -= 1
+
+    def kbest(self, k=None, score=None, tree_class=ParseTree):
+        """Yield the k best parse trees, best first; see best_states."""
+        for i, state in self.best_states(k, score):
+            yield state.parse_tree(tree_class, i)
+
+    def evaluate(self, state):
+        """Run the grammar's semantic actions over the derivation of a
+        complete state, and return the value. This is equivalent to calling
+        self.grammar.eval on the state's parse tree, but it builds no tree:
+        the actions are applied bottom-up, using an explicit stack rather
+        than recursion, with the values of the children of each state on
+        top of a value stack."""
+        action = self.grammar.action
+        values = []
+        stack = [(True, state)]
+        while stack:
+            expand, x = stack.pop()
+            if not isinstance(x, State):
+                values.append(x) # a token
+            elif expand:
+                stack.append((False, x))
+                stack.extend((True, y) for y in reversed(x.matched))
+            else:
+                i = len(values) - len(x.matched)
+                value = action(x.rule)(values[i:])
+                del values[i:]
+                values.append(value)
+        return values[0]
 
     def pprint(self):
         for i in range(len(self)):
@@ -127,7 +471,58 @@ class Parser(object):
                 print u"  %s" % state
             print
 
-def parse(input, grammar):
-    parser = Parser(grammar)
+# Scores for parses (see Parser.best_states). A score is a function of the
+# end of a parse, its complete state, and a memo dictionary that is shared
+# by all of the states scored together. Lower scores are better, so that
+# scores may be combined by returning tuples.
+
+def longest_span(i, state, memo):
+    """Prefer parses that span more tokens."""
+    return -i
+
+def derivation_cost(state, cost, memo):
+    """Return the sum of cost(rule) over the productions used in the
+    derivation of a complete state. Sums for the states below it are saved
+    in (and taken from) memo, keyed on the cost function and the state."""
+    stack = [state]
+    while stack:
+        x = stack[-1]
+        if (cost, id(x)) in memo:
+            stack.pop()
+            continue
+        children = [y for y in x.matched if isinstance(y, State)]
+        pending = [y for y in children if (cost, id(y)) not in memo]
+        if pending:
+            stack.extend(pending)
+        else:
+            stack.pop()
+            memo[(cost, id(x))] = cost(x.rule) + sum(memo[(cost, id(y))]
+                                                     for y in children)
+    return memo[(cost, id(state))]
+
+def count_rule(rule):
+    return 1
+
+def fewest_rules(i, state, memo):
+    """Prefer parses with fewer productions (i.e., flatter trees)."""
+    return derivation_cost(state, count_rule, memo)
+
+class ProductionWeights(object):
+    """Prefer parses whose productions have the least total weight, where
+    the weights (e.g., negative log probabilities) are given in a
+    dictionary keyed on production."""
+
+    def __init__(self, weights, default=0):
+        self.weights = weights
+        self.default = default
+
+    def weight(self, rule):
+        return self.weights.get(rule, self.default)
+
+    def __call__(self, i, state, memo):
+        return derivation_cost(state, self.weight, memo)
+
+def parse(input, grammar, tables=None, leo=False):
+    parser = Parser(grammar, tables, leo)
     parser.parse(input)
     return parser.parses()
@@ -0,0 +1,243 @@
+"""Check the accelerated parsing modes against the reference parser.
+
+The timex grammar is ambiguous, and which parse timex.parse returns depends
+on the order in which the parser finds them, so an optimization that
+changes that order can change the output without breaking anything else.
+This harness tags a corpus with the reference settings and with each of a
+set of accelerated modes (parse tables, fused evaluation, scored parse
+selection, a span window derived from the grammar, or tables and fused
+evaluation together), and reports every sentence on which a mode yields
+a different timex span or value, together with its throughput relative
+to the reference. (Leo's optimization is not among them: it does change
+the order, and so the parse chosen for some ambiguous phrases.)
+
+Usage:
+
+    python equivalence.py [--timebank DIR] [--sentences N] [--phrases N]
+                          [--repeat N] [--limit N] [MODE ...]
+
+The corpus consists of generated newswire-like sentences (see bench.py),
+randomly generated temporal phrases, and, with --timebank, the sentences of
+the TimeML files in DIR. The reference is the plain parser, driven
+directly rather than through timex.spans. The exit status is nonzero if
+any mode that is expected to match the reference diverges; the longest
+and window modes may choose other parses by design."""
+
+import argparse
+import codecs
+import os
+import random
+import sys
+import time
+
+import timex
+from earley import Parser, ParseTables, longest_span
+from resolve import structure
+
+def mode_options(grammar):
+    """Return a dictionary mapping the name of each accelerated mode to the
+    keyword arguments for timex.spans that select it."""
+    tables = ParseTables(grammar)
+    return {"tables": {"tables": tables},
+            "fused": {"fused": True},
+            "longest": {"score": longest_span},
+            "window": {"max_span": "auto"},
+            "tables+fused": {"tables": tables, "fused": True}}
+
+# Modes that may choose other parses by design: the longest parse rather
+# than the first one found, or none longer than the window. Their
+# divergences are reported, but don't affect the exit status.
+inexact_modes = frozenset(["longest", "window"])
+
+# Corpora.
+
+numbers = ["two", "three", "5", "18", "a few", "several", "twenty-one"]
+units = ["day", "days", "week", "weeks", "month", "months", "quarter",
+         "year", "years", "decade", "hours", "minutes"]
+weekdays = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday",
+            "Saturday", "Sunday"]
+months = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+years = ["1987", "1998", "2000", "2011", "nineteen ninety-nine"]
+templates = ["{number} {unit} ago", "{number} {unit} later",
+             "the past {number} {unit}", "the next {number} {unit}",
+             "last {unit}", "next {unit}", "this {unit}",
+             "earlier this {unit}",
+             "last {weekday}", "next {weekday}", "{weekday}",
+             "{month} {day}", "{month} {day} , {year}", "{day} {month} {year}",
+             "early {year}", "late {month}", "the {ordinal} quarter of {year}",
+             "{number} {unit} after {weekday}", "about {number} {unit}",
+             "at least the past {number} {unit}", "{month} {year}",
+             "{weekday} , {month} {day}", "every {unit}", "{year}"]
+
+def generate_phrases(phrases=200, seed=1984):
+    """Return a list of tokenized temporal phrases, generated from a fixed
+    seed by filling in templates at random."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(phrases):
+        phrase = rng.choice(templates).format(
+            number=rng.choice(numbers), unit=rng.choice(units),
+            weekday=rng.choice(weekdays), month=rng.choice(months),
+            day=str(rng.randint(1, 31)), year=rng.choice(years),
+            ordinal=rng.choice(["first", "second", "third", "fourth"]))
+        corpus.append(phrase.split())
+    return corpus
+
+def plain_tokens(sentence):
+    """Flatten a sentence read from a TimeML file into a list of strings,
+    replacing tags with the words they contain."""
+    tokens = []
+    for token in sentence:
+        if isinstance(token, basestring):
+            tokens.append(token)
+        elif isinstance(token, list):
+            tokens.extend(plain_tokens(token))
+        else:
+            tokens.extend("".join(node.data
+                                  for node in token.element.childNodes
+                                  if node.nodeType == node.TEXT_NODE).split())
+    return tokens
+
+def timebank_sentences(directory):
+    """Return the tokenized sentences of the TimeML files in a directory."""
+    from get_tml import TMLFile
+    return [plain_tokens(sentence)
+            for filename in sorted(os.listdir(directory))
+            if filename.endswith(".tml")
+            for sentence in TMLFile(os.path.join(directory, filename)).sents]
+
+# Comparison.
+
+def reference_spans(sentence, grammar):
+    """Return the stand-off span records (see timex.spans) for a sentence,
+    found as timex.parse originally found its timexes, independently of
+    the code that the accelerated modes share: at each position, parse
+    the rest of the sentence with a plain parser, and evaluate the first
+    complete parse tree."""
+    parser = Parser(grammar)
+    offsets = timex.token_offsets(sentence)
+    records = []
+    i = 0
+    while i < len(sentence):
+        parser.parse(sentence[i:])
+        try:
+            tree = parser.parses().next()
+        except StopIteration:
+            i += 1
+            continue
+        n = len(list(tree.leaves()))
+        value = grammar.eval(tree)
+        if not isinstance(value, timex.DoNotParse):
+            records.append((i, i + n, offsets[i][0], offsets[i + n - 1][1],
+                            value))
+        i += n
+    return records
+
+def tag(corpus, tagger, repeat=1):
+    """Tag each sentence of a corpus with a function that returns its
+    stand-off span records, and return the list of records for each one
+    and the best time taken over repeat runs."""
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        tagged = [tagger(sentence) for sentence in corpus]
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return tagged, best
+
+def diff_spans(expected, actual):
+    """Compare two lists of span records, and return a pair of lists: the
+    records only in the first, and those only in the second. Values are
+    compared by structure (see resolve.structure), not identity."""
+    key = lambda record: (record[0], record[1], structure(record[4]))
+    expected_keys = set(map(key, expected))
+    actual_keys = set(map(key, actual))
+    return ([record for record in expected
+             if key(record) not in actual_keys],
+            [record for record in actual
+             if key(record) not in expected_keys])
+
+def compare(corpus, grammar, modes, repeat=1):
+    """Tag a corpus with the reference parser (see reference_spans) and
+    with each of the given modes (a dictionary as returned by
+    mode_options), and return a dictionary mapping each mode name to a
+    dictionary with its time in seconds, its speedup over the reference
+    and a list of divergences, triples of the form (sentence index,
+    reference only, mode only)."""
+    expected, reference_time = tag(corpus,
+                                   lambda sentence: reference_spans(sentence,
+                                                                    grammar),
+                                   repeat)
+    results = {}
+    for name, options in sorted(modes.items()):
+        actual, seconds = tag(corpus,
+                              lambda sentence: list(timex.spans(sentence,
+                                                                grammar,
+                                                                **options)),
+                              repeat)
+        divergences = []
+        for i in range(len(corpus)):
+            missing, extra = diff_spans(expected[i], actual[i])
+            if missing or extra:
+                divergences.append((i, missing, extra))
+        results[name] = {"seconds": seconds,
+                         "speedup": reference_time / seconds,
+                         "divergences": divergences}
+    return results
+
+def report(corpus, results, limit=None, out=None):
+    out = out or codecs.getwriter("UTF-8")(sys.stdout)
+    tokens = sum(len(sentence) for sentence in corpus)
+    out.write(u"%d sentences, %d tokens\n" % (len(corpus), tokens))
+    for name, result in sorted(results.items()):
+        out.write(u"%-12s %8.3fs %8.0f tokens/s %6.2fx %5d divergent%s\n" %
+                  (name, result["seconds"], tokens / result["seconds"],
+                   result["speedup"], len(result["divergences"]),
+                   u" (may differ)" if name in inexact_modes else u""))
+        for i, missing, extra in result["divergences"][:limit]:
+            out.write(u"  %d: %s\n" % (i, u" ".join(corpus[i])))
+            for sign, records in ((u"-", missing), (u"+", extra)):
+                for start, end, _, _, value in records:
+                    out.write(u"    %s [%d:%d] %s\n" %
+                              (sign, start, end, describe(value)))
+
+def describe(value):
+    try:
+        return unicode(value)
+    except Exception:
+        return repr(value)
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    argparser.add_argument("modes", nargs="*", metavar="MODE",
+                           help="modes to check (default: all of them)")
+    argparser.add_argument("--timebank", metavar="DIR",
+                           help="also tag the TimeML files in DIR")
+    argparser.add_argument("--sentences", type=int, default=200,
+                           help="number of generated sentences")
+    argparser.add_argument("--phrases", type=int, default=200,
+                           help="number of generated temporal phrases")
+    argparser.add_argument("--repeat", type=int, default=1,
+                           help="time the best of N runs of each mode")
+    argparser.add_argument("--limit", type=int, default=None,
+                           help="report at most LIMIT divergences per mode")
+    args = argparser.parse_args()
+
+    from bench import generate_corpus
+    corpus = generate_corpus(args.sentences) + generate_phrases(args.phrases)
+    if args.timebank:
+        corpus += timebank_sentences(args.timebank)
+    grammar = timex.read_timex_grammar()
+    modes = mode_options(grammar)
+    for name in args.modes:
+        if name not in modes:
+            argparser.error("unknown mode %r (choose from %s)" %
+                            (name, ", ".join(sorted(modes))))
+    if args.modes:
+        modes = dict((name, modes[name]) for name in args.modes)
+    results = compare(corpus, grammar, modes, args.repeat)
+    report(corpus, results, args.limit)
+    sys.exit(any(result["divergences"] for name, result in results.items()
+                 if name not in inexact_modes))
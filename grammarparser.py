@@ -2,14 +2,17 @@
 
 __author__ = "Alex Plotnick <plotnick@cs.brandeis.edu>"
 
+import os
+import threading
 from StringIO import StringIO
 from tokenize import *
 from tokenize import TokenError
 
 from cfg import *
-from earley import Parser
+from earley import Parser, ParseTables
 
-__all__ = ["parse_grammar_spec"]
+__all__ = ["parse_grammar_spec", "load_grammar_spec", "GrammarSpecError",
+           "GrammarHandle"]
 
 EXPR = N_TOKENS
 LIST = N_TOKENS + 1
@@ -60,8 +63,11 @@ class GrammarSpecTokenizer(object):
                 if value in self.delimiters.keys():
                     self.delimstack.append(self.delimiters[value])
                 elif value in self.delimiters.values():
+                    if not self.delimstack:
+                        raise TokenError("unmatched %r" % value, token[2])
                     if self.delimstack.pop() != value:
-                        raise TokenError("improperly nested delimiters")
+                        raise TokenError("improperly nested delimiters",
+                                         token[2])
             return token
 
         def getdelimitedtoks(delimiter):
@@ -71,8 +77,14 @@ class GrammarSpecTokenizer(object):
 
         token = getnext()
         if self.delimstack:
-            return (self.delimtypes[token[1]],
-                    untokenize(tuple(getdelimitedtoks(token)))) + token[2:]
+            try:
+                tokens = tuple(getdelimitedtoks(token))
+            except TokenError as e:
+                if e.args[0].startswith("EOF"):
+                    # Report the delimiter that was never closed.
+                    raise TokenError("unclosed %r" % token[1], token[2])
+                raise
+            return (self.delimtypes[token[1]], untokenize(tokens)) + token[2:]
         else:
             return token
 
@@ -85,8 +97,10 @@ class InvalidActionError(Exception):
 # not the module from which that is called, which is what we want. To work
 # around this problem, parse_grammar_spec() accepts an argument which it
 # assigns to the following variable, and we use that as the globals
-# argument to eval() or exec.
+# argument to eval() or exec. Since that variable is shared, grammars are
+# read while holding the following lock.
 grammar_globals = None
+grammar_globals_lock = threading.RLock()
 
 def compile_action(lhs, action):
     """Given a rule name (lhs) and an action specification, compile and
@@ -146,6 +160,8 @@ grammar_spec_grammar = AttributeGrammar([
        lambda rhs: tuple(rhs)),
       (Production("rhs", ("symlist")),
        lambda rhs: (rhs[0], None)),
+      (Production("rhs", ("action")), # empty
+       lambda rhs: ([], rhs[0])),
       (Production("symlist", ("symlist", "sym")),
        lambda rhs: rhs[0] + [rhs[1]]),
       (Production("symlist", ("sym")),
@@ -170,6 +186,227 @@ def parse_grammar_spec(spec, start, globals=None,
     assert issubclass(grammar_class, AttributeGrammar), \
         "Grammar class must be a subclass of AttributeGrammar."
     global grammar_globals
-    grammar_globals = globals
-    parser.parse(GrammarSpecTokenizer(spec))
-    return grammar_class(parser.grammar.eval(parser.parses().next()), start)
+    with grammar_globals_lock:
+        grammar_globals = globals
+        parser.parse(GrammarSpecTokenizer(spec))
+        return grammar_class(parser.grammar.eval(parser.parses().next()),
+                             start)
+
+class GrammarSpecError(SyntaxError):
+    pass
+
+class GrammarSpecReader(object):
+    """A recursive-descent reader for grammar specifications. It accepts the
+    same language as grammar_spec_grammar and builds the same rules, but in
+    a single left-to-right pass over the tokens, with at most two tokens of
+    lookahead."""
+
+    def __init__(self, spec, filename="<grammar>"):
+        self.tokens = GrammarSpecTokenizer(spec)
+        self.filename = filename
+        self.lookahead = []
+
+    def peek(self, n=0):
+        while len(self.lookahead) <= n:
+            try:
+                self.lookahead.append(self.tokens.next())
+            except TokenError as e:
+                message, (lineno, col_offset) = e.args
+                raise GrammarSpecError(message, (self.filename, lineno,
+                                                 col_offset + 1, None))
+        return self.lookahead[n]
+
+    def next(self):
+        self.peek()
+        return self.lookahead.pop(0)
+
+    def at(self, type, value=None, n=0):
+        token = self.peek(n)
+        return token[0] == type and (value is None or token[1] == value)
+
+    def expect(self, type, value=None):
+        if not self.at(type, value):
+            self.error("expected %s" % (repr(value) if value else
+                                        tok_name[type]))
+        return self.next()
+
+    def error(self, message, token=None):
+        """Raise a GrammarSpecError at the given token, or at the next one,
+        which is then included in the message."""
+        if token is None:
+            token = self.peek()
+            if token[0] != ENDMARKER:
+                message += ", found %r" % token[1]
+        # Delimited tokens carry the position of their opening delimiter.
+        (lineno, col_offset), line = token[-3], token[-1]
+        raise GrammarSpecError(message,
+                               (self.filename, lineno, col_offset + 1, line))
+
+    def read(self):
+        """Read a whole specification, and return a list of (production,
+        action) pairs."""
+        rules = []
+        rules.extend(self.prod())
+        while True:
+            if self.at(NEWLINE):
+                self.next()
+            if self.at(ENDMARKER):
+                return rules
+            rules.extend(self.prod())
+
+    def prod(self):
+        lhs = self.expect(NAME)[1]
+        self.expect(OP, "-")
+        self.expect(OP, ">")
+        alts = [self.rhs()]
+        while (self.at(OP, "|") or
+               (self.at(NEWLINE) and self.at(OP, "|", 1))):
+            if self.at(NEWLINE):
+                self.next()
+            self.next()
+            alts.append(self.rhs())
+        return [(Production(lhs, symbols), self.action(lhs, action))
+                for symbols, action in alts]
+
+    def action(self, lhs, token):
+        try:
+            return compile_action(lhs, token)
+        except (SyntaxError, InvalidActionError) as e:
+            self.error("invalid action for %s: %s" %
+                       (lhs, getattr(e, "msg", None) or e), token)
+
+    def rhs(self):
+        symbols = []
+        # A name followed by an arrow starts the next production.
+        while (self.at(STRING) or
+               (self.at(NAME) and not self.at(OP, "-", 1))):
+            symbols.append(self.sym())
+        if self.at(EXPR):
+            return symbols, self.next()
+        elif not symbols:
+            self.error("expected a symbol or an action")
+        return symbols, None
+
+    def sym(self):
+        token = self.next()
+        if token[0] == STRING: # literal, either string or regexp
+            s = token[1]
+            if s[0] == "r" or s[:2] == "ur":
+                return RegexpTerminal(eval(s))
+            else:
+                return Literal(eval(s))
+        elif self.at(TUPLE): # funcall
+            call = token[1] + self.next()[1]
+            try:
+                return eval(call, grammar_globals)
+            except Exception as e:
+                self.error("can't make terminal %s: %s: %s" %
+                           (call, type(e).__name__, e), token)
+        else: # nonterminal
+            return token[1]
+
+def load_grammar_spec(spec, start, globals=None,
+                      grammar_class=AttributeGrammar, filename="<grammar>"):
+    """Like parse_grammar_spec, but read the specification with a
+    recursive-descent reader instead of the general Earley parser, which
+    takes time linear in the length of the specification. Syntax errors
+    are reported as GrammarSpecErrors, with the given filename and the
+    line number at which they were detected."""
+    assert issubclass(grammar_class, AttributeGrammar), \
+        "Grammar class must be a subclass of AttributeGrammar."
+    global grammar_globals
+    with grammar_globals_lock:
+        grammar_globals = globals
+        return grammar_class(GrammarSpecReader(spec, filename).read(), start)
+
+class GrammarHandle(object):
+    """A reloadable reference to a grammar read from a specification file.
+
+    Long-running processes should get the current grammar from the handle
+    once per parse and hold on to it until the parse is done. A reload
+    builds a complete new grammar (and parse tables, if requested) and then
+    swaps it in with a single assignment, so parses already under way finish
+    with the grammar they started with, and new ones get the new grammar.
+    Reloads may be requested explicitly, or a background thread may watch
+    the file for changes. If the new specification can't be loaded, the
+    current grammar stays in place."""
+
+    def __init__(self, filename, start, globals=None,
+                 grammar_class=AttributeGrammar, tables=False):
+        self.filename = filename
+        self.start = start
+        self.globals = globals
+        self.grammar_class = grammar_class
+        self.tables = tables
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.error = None
+        self.watcher = None
+        self.reload()
+
+    def get(self):
+        """Return the current grammar and its parse tables (None unless the
+        handle was created with tables=True), as a pair."""
+        return self.current
+
+    @property
+    def grammar(self):
+        return self.current[0]
+
+    def file_stamp(self):
+        st = os.stat(self.filename)
+        return (st.st_mtime, st.st_size)
+
+    def reload(self):
+        """Read the specification file, and swap in the new grammar. If it
+        can't be read, raise an exception and keep the current grammar."""
+        with self.lock:
+            self.stamp = self.file_stamp()
+            with open(self.filename) as f:
+                grammar = self.load(f.read())
+            self.current = (grammar,
+                            ParseTables(grammar) if self.tables else None)
+            self.error = None
+
+    def load(self, spec):
+        """Build a grammar from the text of the specification. Subclasses
+        may extend this to attach other data derived from the same text to
+        the grammar, so that it is swapped in along with it."""
+        return load_grammar_spec(StringIO(spec).readline, self.start,
+                                 self.globals, self.grammar_class,
+                                 self.filename)
+
+    def check(self):
+        """Reload the grammar if the file has changed since it was last
+        read. Returns true if a new grammar was swapped in; if loading it
+        failed, the exception is saved in the error attribute."""
+        try:
+            if self.file_stamp() == self.stamp:
+                return False
+            self.reload()
+        except Exception as e:
+            self.error = e
+            return False
+        return True
+
+    def watch(self, interval=1.0):
+        """Start a daemon thread that checks for changes to the file every
+        interval seconds."""
+        if self.watcher:
+            return
+        stop = threading.Event()
+        def run():
+            while not stop.wait(interval):
+                self.check()
+        thread = threading.Thread(target=run, name="watch %s" % self.filename)
+        thread.daemon = True
+        self.watcher = (thread, stop)
+        thread.start()
+
+    def unwatch(self):
+        """Stop watching the file."""
+        if self.watcher:
+            thread, stop = self.watcher
+            self.watcher = None
+            stop.set()
+            thread.join()
@@ -0,0 +1,138 @@
+# -*- mode: Python; coding: utf-8 -*-
+"""Attribute the cost of parsing a corpus to individual productions.
+
+For each production, we count how many states were predicted (dot at the
+start of the rule), how many were advanced past at least one symbol, how
+many were completed, and how many times the production was used in a
+parse that was actually chosen. Rules that are predicted often but rarely
+complete or get used are the ones that make the chart grow for nothing.
+
+Usage:
+
+    python grammarprofile.py [--sort COLUMN] [--nonterminals] [FILE ...]
+
+Each FILE should contain one whitespace-tokenized sentence per line; with
+no files, a generated newswire-like corpus (see bench.py) is profiled
+against the timex grammar."""
+
+import argparse
+import codecs
+import sys
+
+from earley import Parser
+
+class GrammarProfile(object):
+    columns = ("predicted", "advanced", "completed", "used")
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.counts = {}
+        for rule in grammar.rules:
+            if rule is not None:
+                self.counts[rule] = [0] * len(self.columns)
+
+    def add_chart(self, parser):
+        """Count the states in a parser's chart."""
+        for column in parser.chart:
+            for state in column:
+                counts = self.counts.get(state.rule)
+                if counts is None:
+                    continue # the parser's own start rule
+                if state.dot == 0:
+                    counts[0] += 1
+                else:
+                    counts[1] += 1
+                if state.complete:
+                    counts[2] += 1
+
+    def add_tree(self, tree):
+        """Count the productions used in a chosen parse tree."""
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if node.node in self.counts:
+                self.counts[node.node][3] += 1
+            stack.extend(child for child in node.children or ()
+                         if hasattr(child, "node"))
+
+    def sorted_rows(self, rows, sort=None):
+        if sort:
+            key = self.columns.index(sort)
+            rows.sort(key=lambda row: row[1][key], reverse=True)
+        return rows
+
+    def rules(self, sort=None):
+        """Return a list of (production, counts) pairs, sorted in descending
+        order by the given column, or in grammar order."""
+        rows = [(rule, self.counts[rule])
+                for rule in self.grammar.rules
+                if rule is not None] # removed productions leave None
+        return self.sorted_rows(rows, sort)
+
+    def nonterminals(self, sort=None):
+        """Return a list of (nonterminal, counts) pairs, with the counts
+        summed over all of the productions for that nonterminal, sorted as
+        for rules; in grammar order, nonterminals are listed in the order
+        of their first productions."""
+        rows = []
+        totals = {}
+        for rule, counts in self.rules():
+            if rule.lhs not in totals:
+                totals[rule.lhs] = [0] * len(self.columns)
+                rows.append((rule.lhs, totals[rule.lhs]))
+            for i, count in enumerate(counts):
+                totals[rule.lhs][i] += count
+        return self.sorted_rows(rows, sort)
+
+    def report(self, sort="predicted", nonterminals=False, limit=None,
+               out=None):
+        out = out or codecs.getwriter("UTF-8")(sys.stdout)
+        rows = self.nonterminals(sort) if nonterminals else self.rules(sort)
+        out.write(u"%10s %10s %10s %10s  %s\n" %
+                  (self.columns + ("nonterminal" if nonterminals else "rule",)))
+        for name, counts in rows[:limit]:
+            out.write(u"%10d %10d %10d %10d  %s\n" %
+                      (tuple(counts) + (unicode(name),)))
+
+def profile(grammar, sentences, profile=None):
+    """Parse each of the sentences the way timex.parse does, at every token
+    position and taking the first parse found, and return a profile of
+    the work done."""
+    profile = profile or GrammarProfile(grammar)
+    parser = Parser(grammar)
+    for sentence in sentences:
+        tokens = list(sentence)
+        while tokens:
+            parser.parse(tokens)
+            profile.add_chart(parser)
+            try:
+                tree = parser.parses().next()
+            except StopIteration:
+                del tokens[0]
+                continue
+            profile.add_tree(tree)
+            del tokens[0:tree.end]
+    return profile
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    argparser.add_argument("files", nargs="*", metavar="FILE")
+    argparser.add_argument("--sort", choices=GrammarProfile.columns,
+                           default="predicted")
+    argparser.add_argument("--nonterminals", action="store_true",
+                           help="report totals per nonterminal")
+    argparser.add_argument("--limit", type=int, default=None,
+                           help="report only the first LIMIT rows")
+    args = argparser.parse_args()
+
+    import timex
+    if args.files:
+        sentences = [line.split()
+                     for filename in args.files
+                     for line in codecs.open(filename, "r", "UTF-8")]
+    else:
+        from bench import generate_corpus
+        sentences = generate_corpus()
+    profile(timex.read_timex_grammar(), sentences).report(args.sort,
+                                                          args.nonterminals,
+                                                          args.limit)
@@ -0,0 +1,302 @@
+"""Resolve parsed timexes to concrete ISO 8601 values.
+
+Most of the temporal functions in timex.py denote values only relative to
+an anchor: the document creation time (for UtteranceTime) or a reference
+time (for ReferenceTime). Given those as dates, a Resolver computes TIMEX3
+value strings such as "2011-06", "2011-W27" or "2011-07-13":
+
+    >>> resolver = Resolver()
+    >>> resolver.resolve(Decrement(Month)(UtteranceTime()), date(2011, 7, 14))
+    '2011-06'
+
+Internally, a time point is a pair (date, unit), where the date is any day
+within the point and the unit gives its granularity; calendar arithmetic is
+done on proleptic Gregorian day ordinals and month counts. Timexes that
+can't (yet) be resolved, such as durations, frequencies and vague
+references, resolve to None. A resolver memoizes the value of every
+(timex, anchor, reference) triple it sees, so that the repeated timexes
+of a corpus ("today", "last year") are each resolved only once per
+document creation time; use one resolver per batch."""
+
+import calendar
+from datetime import date, datetime
+
+from iso8601.iso8601 import TimeUnit, TimeRep
+from timex import TemporalFunction, TemporalModifier, UtteranceTime, \
+    ReferenceTime, CoercedTimePoint, IncrementOrDecrement, Decrement, \
+    AnchoredTimePoint, PastRef, NextOrLastInstance, NextInstance
+
+# Units are identified by the name of the first class in their method
+# resolution order that we know about, so that plural duration units and
+# their singular counterparts are treated alike.
+unit_names = {"Year": "Year", "Years": "Year",
+              "Quarter": "Quarter", "Quarters": "Quarter",
+              "Month": "Month", "Months": "Month",
+              "Week": "Week", "Weeks": "Week",
+              "DayOfWeek": "DayOfWeek", "DayOfMonth": "DayOfMonth",
+              "Day": "Day", "Days": "Day",
+              "Hour": "Hour", "Hours": "Hour",
+              "Minute": "Minute", "Minutes": "Minute",
+              "Second": "Second", "Seconds": "Second"}
+
+def unit_name(unit):
+    """Return the name of the unit of a TimeUnit instance or class, or None
+    if it is unknown."""
+    cls = unit if isinstance(unit, type) else type(unit)
+    for c in cls.__mro__:
+        if c.__name__ in unit_names:
+            return unit_names[c.__name__]
+
+def unit_value(unit):
+    """Return the value of a TimeUnit as an integer, or None if it doesn't
+    have an integral value."""
+    value = getattr(unit, "value", None)
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return None
+    return n if isinstance(value, basestring) or n == value else None
+
+def to_date(anchor):
+    """Coerce an anchor, which may be a date, a datetime, or a string of the
+    form YYYY-MM-DD or YYYYMMDD (possibly followed by a time), to a date."""
+    if isinstance(anchor, datetime):
+        return anchor.date()
+    elif isinstance(anchor, date):
+        return anchor
+    elif isinstance(anchor, basestring):
+        digits = anchor.strip()[:10].replace("-", "")
+        return date(int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
+    raise TypeError("invalid anchor: %r" % (anchor,))
+
+# Calendar arithmetic.
+
+def add_months(day, n):
+    year, month = divmod(day.year * 12 + day.month - 1 + n, 12)
+    return date(year, month + 1,
+                min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+def add_days(day, n):
+    return date.fromordinal(day.toordinal() + n)
+
+def add(day, unit, n):
+    """Add n units to a day."""
+    if unit == "Year":
+        return add_months(day, 12 * n)
+    elif unit == "Quarter":
+        return add_months(day, 3 * n)
+    elif unit == "Month":
+        return add_months(day, n)
+    elif unit == "Week":
+        return add_days(day, 7 * n)
+    elif unit == "Day":
+        return add_days(day, n)
+
+def weekday(n):
+    """Convert a DayOfWeek value (1 = Sunday, ..., 7 = Saturday) to a Python
+    weekday number (0 = Monday, ..., 6 = Sunday)."""
+    return (n - 2) % 7
+
+def format_point(point):
+    """Return the TIMEX3 value for a time point."""
+    day, unit = point
+    if unit == "Year":
+        return "%04d" % day.year
+    elif unit == "Quarter":
+        return "%04d-Q%d" % (day.year, (day.month - 1) // 3 + 1)
+    elif unit == "Month":
+        return "%04d-%02d" % (day.year, day.month)
+    elif unit == "Week":
+        year, week, _ = day.isocalendar()
+        return "%04d-W%02d" % (year, week)
+    elif unit == "Day":
+        return day.isoformat()
+
+class Resolver(object):
+    def __init__(self):
+        self.memo = {}
+        self.hits = 0
+
+    def resolve(self, timex, anchor, reference=None):
+        """Return the TIMEX3 value of a timex as a string, or None if it
+        can't be resolved. The anchor is the document creation time, and
+        the reference time defaults to it."""
+        anchor = to_date(anchor)
+        reference = to_date(reference) if reference is not None else anchor
+        key = (structure(timex), anchor, reference)
+        try:
+            value = self.memo[key]
+            self.hits += 1
+            return value
+        except KeyError:
+            pass
+        point = self.point(timex, anchor, reference)
+        value = self.memo[key] = format_point(point) if point else None
+        return value
+
+    def resolve_many(self, timexes, anchors, references=None):
+        """Resolve a batch of timexes, each with its own anchor (and,
+        optionally, reference time), and return a list of values."""
+        if references is None:
+            references = [None] * len(anchors)
+        return [self.resolve(timex, anchor, reference)
+                for timex, anchor, reference in zip(timexes, anchors,
+                                                    references)]
+
+    def point(self, timex, anchor, reference):
+        """Return the time point denoted by a timex, or None."""
+        if isinstance(timex, UtteranceTime):
+            return (anchor, "Day")
+        elif isinstance(timex, ReferenceTime):
+            return (reference, "Day")
+        elif isinstance(timex, TemporalModifier):
+            return self.point(timex.timex, anchor, reference)
+        elif isinstance(timex, CoercedTimePoint):
+            point = self.point(timex.timepoint, anchor, reference)
+            return point and self.coerce(point, timex.unit)
+        elif isinstance(timex, IncrementOrDecrement):
+            point = self.anchor_point(timex, anchor, reference)
+            unit = unit_name(timex.unit)
+            if not point or unit not in ("Year", "Quarter", "Month", "Week",
+                                         "Day"):
+                return None
+            n = -1 if isinstance(timex, Decrement) else 1
+            return (add(point[0], unit, n), unit)
+        elif isinstance(timex, AnchoredTimePoint):
+            point = self.anchor_point(timex, anchor, reference)
+            offset = self.duration(timex.duration)
+            if not (point and offset):
+                return None
+            months, days, unit = offset
+            sign = -1 if isinstance(timex, PastRef) else 1
+            return (add_days(add_months(point[0], sign * months), sign * days),
+                    unit)
+        elif isinstance(timex, NextOrLastInstance):
+            point = self.anchor_point(timex, anchor, reference)
+            return point and self.instance(point, timex.timepoint,
+                                           isinstance(timex, NextInstance))
+        elif isinstance(timex, TimeRep):
+            return self.date(timex, anchor)
+        elif isinstance(timex, TimeUnit):
+            return self.date(timex, anchor)
+
+    def anchor_point(self, timex, anchor, reference):
+        # Functions built without an explicit anchor are anchored in the
+        # reference time.
+        if timex.anchor is None:
+            return (reference, "Day")
+        return self.point(timex.anchor, anchor, reference)
+
+    def coerce(self, point, unit):
+        """Coerce a time point to a unit, which may be a TimeUnit class
+        (e.g., Week) or instance (e.g., Month(7) or DayOfWeek(3))."""
+        day, _ = point
+        name = unit_name(unit)
+        if isinstance(unit, type):
+            return (day, name) if name in ("Year", "Quarter", "Month", "Week",
+                                           "Day") else None
+        value = unit_value(unit)
+        if not value:
+            return None
+        elif name == "Month":
+            return (date(day.year, value, 1), "Month")
+        elif name == "DayOfWeek":
+            return (add_days(day, weekday(value) - day.weekday()), "Day")
+
+    def instance(self, point, timepoint, forward):
+        """Return the next (or last) instance of a weekday or month strictly
+        after (or before) a time point."""
+        day, _ = point
+        name = unit_name(timepoint)
+        value = unit_value(timepoint) if isinstance(timepoint, TimeUnit) \
+                                      else None
+        if not value:
+            return None
+        elif name == "DayOfWeek":
+            if forward:
+                delta = (weekday(value) - day.weekday()) % 7 or 7
+            else:
+                delta = -((day.weekday() - weekday(value)) % 7 or 7)
+            return (add_days(day, delta), "Day")
+        elif name == "Month":
+            if forward:
+                delta = (value - day.month) % 12 or 12
+            else:
+                delta = -((day.month - value) % 12 or 12)
+            return (add_months(date(day.year, day.month, 1), delta), "Month")
+
+    def duration(self, duration):
+        """Return a duration as a triple (months, days, unit), where unit is
+        the name of its finest unit, or None if it can't be expressed that
+        way."""
+        months = days = 0
+        finest = None
+        for element in getattr(duration, "elements", ()):
+            if element is None or element.value is None:
+                continue
+            name, value = unit_name(element), unit_value(element)
+            if value is None:
+                return None
+            elif name == "Year":
+                months += 12 * value
+            elif name == "Quarter":
+                months += 3 * value
+            elif name == "Month":
+                months += value
+            elif name == "Week":
+                days += 7 * value
+            elif name == "Day":
+                days += value
+            else:
+                return None
+            finest = name
+        return (months, days, finest) if finest else None
+
+    def date(self, timerep, anchor):
+        """Return the time point denoted by an explicit date (or a single
+        unit, such as a year or a quarter), taking a missing year from the
+        anchor."""
+        units = {}
+        for element in getattr(timerep, "elements", [timerep]):
+            if element is not None:
+                units[unit_name(element)] = unit_value(element)
+        year = units.get("Year")
+        month = units.get("Month")
+        day = units.get("DayOfMonth") or units.get("Day")
+        quarter = units.get("Quarter")
+        if not year:
+            if not (month or quarter):
+                return None
+            year = anchor.year
+        try:
+            if month and day:
+                return (date(year, month, day), "Day")
+            elif month:
+                return (date(year, month, 1), "Month")
+            elif quarter:
+                return (date(year, 3 * quarter - 2, 1), "Quarter")
+            else:
+                return (date(year, 1, 1), "Year")
+        except ValueError:
+            return None
+
+def structure(timex):
+    """Return a hashable description of a timex that is the same for any
+    two timexes that are built the same way, for use as a memo key."""
+    if isinstance(timex, type):
+        return timex
+    elif isinstance(timex, TimeRep):
+        return (type(timex), tuple(structure(element)
+                                   for element in timex.elements))
+    elif isinstance(timex, TimeUnit):
+        return (type(timex), timex.value)
+    elif isinstance(timex, TemporalFunction):
+        return (type(timex), structure(timex.args))
+    elif isinstance(timex, (list, tuple)):
+        return tuple(structure(x) for x in timex)
+    return timex
+
+def resolve_batch(timexes, anchors, references=None):
+    """Resolve a batch of timexes against their anchors with a fresh
+    resolver, and return the list of values."""
+    return Resolver().resolve_many(timexes, anchors, references)
@@ -63,23 +63,23 @@ def print_parses2(phrases):
         print
 
 
-if __name__ == '__main__':
-    
-    phrases = [
-        'third - quarter',
-        'third-quarter',
-        'today',
-        'Sunday',
-        '29 April',
-        'April 29th',
-        'April 29th 2000',
-        'Sunday , and , the first January 25th',
-        #'two weeks',
-        #'January 25th 2011',
-        #'January 25th , 2011',
-        #'Fourth quarter of 2000',
-    ]
+phrases = [
+    'third - quarter',
+    'third-quarter',
+    'today',
+    'Sunday',
+    '29 April',
+    'April 29th',
+    'April 29th 2000',
+    'Sunday , and , the first January 25th',
+    #'two weeks',
+    #'January 25th 2011',
+    #'January 25th , 2011',
+    #'Fourth quarter of 2000',
+]
+
 
+if __name__ == '__main__':
     print_parses(phrases)
     print_parses2(phrases)
 
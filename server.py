@@ -0,0 +1,351 @@
+"""A local HTTP tagging service.
+
+The timex grammar is read once, when this module imports timex, and a pool
+of worker processes is then forked from the loaded parent so that every
+worker shares it. Clients POST batches of sentences as JSON to /tag:
+
+    {"sentences": ["April 29th 2000", ["last", "week"]], "timeout": 5}
+
+Each sentence may be either a string, which is split on whitespace, or a
+list of tokens. The response contains one result list per sentence, in
+order; plain tokens are passed through as strings, and timexes are given
+as objects with their type, value and the number of tokens they consumed,
+and for temporal functions, the descriptions of their arguments.
+Latency histograms are available from /stats. With --watch, each worker
+checks the grammar file for changes periodically, and reloads it without
+restarting (see timex.timex_grammar).
+
+With --preload, the server prepares the loaded parent for forking first:
+it tags a sample sentence, so that lazily built state exists before the
+fork, collects garbage, and then moves every surviving object out of the
+collector's reach (gc.freeze, where available), so that collections in
+the workers don't touch, and thereby copy, the pages holding the grammar.
+Reference counting still dirties some of them, so /stats reports the
+resident, shared and private memory of each worker (on Linux)."""
+
+import argparse
+import errno
+import functools
+import gc
+import json
+import multiprocessing
+import os
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from Queue import Empty
+from SocketServer import ThreadingMixIn
+
+import timex
+from iso8601.iso8601 import TimeRep, Format
+from timex import TemporalFunction
+
+def format_value(value):
+    """Return the text of a parsed timex or part of one, formatting any
+    TimeReps inside it."""
+    if isinstance(value, TimeRep):
+        # Printing a TimeRep directly doesn't work; format it instead.
+        return Format(value.stdformat).format(value)
+    elif isinstance(value, type):
+        return value.__name__
+    elif isinstance(value, TemporalFunction):
+        return "%s(%s)" % (type(value).__name__,
+                           ", ".join(format_value(x) for x in value.args))
+    return str(value)
+
+# Values that are described by themselves.
+json_types = (basestring, int, long, float, bool)
+
+def describe(value):
+    """Return a JSON-ready description of a parsed timex: its type, its
+    text and, for a temporal function, the descriptions of its arguments.
+    Strings, numbers and None are described by themselves."""
+    if isinstance(value, TemporalFunction):
+        return {"type": type(value).__name__,
+                "value": format_value(value),
+                "args": [x if x is None or isinstance(x, json_types)
+                         else describe(x) for x in value.args]}
+    return {"type": type(value).__name__, "value": format_value(value)}
+
+def tag_sentence(tokens, deadline=None):
+    """Tag one sentence in a worker process. Returns the tagged sentence
+    and the time it took, in seconds. If a deadline is given (in seconds
+    since the epoch), parsing stops when it passes, and since the rest of
+    the sentence would be left untagged (see timex.parse), the sentence
+    fails with multiprocessing.TimeoutError instead."""
+    start = time.time()
+    max_time = max(0.0, deadline - start) if deadline is not None else None
+    result = []
+    for n, x in timex.parse2(tokens, max_time=max_time):
+        if isinstance(x, basestring):
+            result.append(x)
+        else:
+            item = describe(x)
+            item["tokens"] = n
+            result.append(item)
+    end = time.time()
+    if deadline is not None and end > deadline:
+        raise multiprocessing.TimeoutError("deadline passed while tagging")
+    return result, end - start
+
+def read_sentences(sentences):
+    """Return the sentences of a request as lists of tokens. Raises
+    ValueError unless they are a list of strings and lists of strings."""
+    if not isinstance(sentences, list):
+        raise ValueError("sentences must be a list")
+    result = []
+    for sentence in sentences:
+        if isinstance(sentence, basestring):
+            result.append(sentence.split())
+        elif (isinstance(sentence, list) and
+              all(isinstance(token, basestring) for token in sentence)):
+            result.append(sentence)
+        else:
+            raise ValueError("a sentence must be a string or a list of "
+                             "strings, not %s" % json.dumps(sentence))
+    return result
+
+def start_worker(pids, watch=None):
+    """Pool initializer: report the worker's process ID on the pids queue,
+    and if watch is given, watch the timex grammar file for changes every
+    that many seconds."""
+    pids.put(os.getpid())
+    if watch:
+        timex.timex_grammar.watch(watch)
+
+def prepare_fork(sample=("April", "29th", "2000")):
+    """Prepare the parent process to fork workers that share as much of
+    its memory as possible with it and each other."""
+    tag_sentence(list(sample))
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+    else:
+        # Without gc.freeze, make full collections, which would traverse
+        # (and write to) every object, much rarer instead.
+        threshold0, threshold1, _ = gc.get_threshold()
+        gc.set_threshold(threshold0, threshold1, 1000)
+
+def memory_usage(pid):
+    """Return a dictionary with the resident, shared and private memory of
+    a process, in kilobytes, read from /proc/PID/smaps; or None if that
+    can't be read."""
+    usage = {"rss": 0, "shared": 0, "private": 0}
+    fields = {"Rss:": "rss",
+              "Shared_Clean:": "shared", "Shared_Dirty:": "shared",
+              "Private_Clean:": "private", "Private_Dirty:": "private"}
+    try:
+        with open("/proc/%d/smaps" % pid) as smaps:
+            for line in smaps:
+                field = fields.get(line[:line.find(":") + 1])
+                if field:
+                    usage[field] += int(line.split()[1])
+    except (IOError, ValueError):
+        return None
+    return usage
+
+def running(pid):
+    """Return true if a process is running."""
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+class LatencyHistogram(object):
+    """A thread-safe histogram of latencies with exponentially growing
+    buckets, starting at one millisecond."""
+
+    def __init__(self, buckets=18):
+        self.bounds = [0.001 * 2**i for i in range(buckets)]
+        self.counts = [0] * (buckets + 1) # last bucket is overflow
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        i = 0
+        while i < len(self.bounds) and seconds > self.bounds[i]:
+            i += 1
+        with self.lock:
+            self.counts[i] += 1
+            self.total += seconds
+
+    def percentile(self, p):
+        """Return an upper bound on the p-th percentile latency."""
+        n = sum(self.counts)
+        if not n: return None
+        seen = 0
+        for bound, count in zip(self.bounds + [None], self.counts):
+            seen += count
+            if seen >= p * n / 100.0:
+                return bound
+        return None
+
+    def snapshot(self):
+        with self.lock:
+            n = sum(self.counts)
+            return {"count": n,
+                    "mean": self.total / n if n else None,
+                    "p50": self.percentile(50),
+                    "p90": self.percentile(90),
+                    "p99": self.percentile(99),
+                    "buckets": [{"le": bound, "count": count}
+                                for bound, count in zip(self.bounds + [None],
+                                                        self.counts)]}
+
+class TaggingServer(ThreadingMixIn, HTTPServer):
+    """A threaded HTTP server that hands batches of sentences to a pool of
+    pre-forked tagging processes."""
+
+    daemon_threads = True
+
+    def __init__(self, address, workers=None, timeout=30.0, max_batch=1000,
+                 watch=None, preload=False):
+        HTTPServer.__init__(self, address, TaggingRequestHandler)
+        if preload:
+            prepare_fork()
+        self.new_pids = multiprocessing.Queue()
+        self.pool = multiprocessing.Pool(workers, start_worker,
+                                         (self.new_pids, watch))
+        self.workers = workers or multiprocessing.cpu_count()
+        # Wait for the workers to start, so that they can all be found.
+        self.pids = set(self.new_pids.get() for i in range(self.workers))
+        self.default_timeout = timeout
+        self.max_batch = max_batch
+        self.request_latency = LatencyHistogram()
+        self.sentence_latency = LatencyHistogram()
+        self.timeouts = 0
+        self.errors = 0
+        self.lock = threading.Lock() # for the counters and pids
+
+    def tag(self, sentences, timeout):
+        """Tag a batch of sentences, blocking for at most timeout seconds.
+        Raises multiprocessing.TimeoutError if the batch doesn't finish.
+        The workers are given the same deadline, so they stop parsing the
+        sentences of a batch that has timed out instead of finishing the
+        work for nothing; a sentence that runs past it fails the batch,
+        even if the batch is otherwise in time, since it can't be
+        completely tagged (see tag_sentence)."""
+        chunksize = max(1, len(sentences) // (4 * self.workers))
+        task = functools.partial(tag_sentence, deadline=time.time() + timeout)
+        result = self.pool.map_async(task, sentences, chunksize)
+        try:
+            results = result.get(timeout)
+        except multiprocessing.TimeoutError:
+            with self.lock:
+                self.timeouts += 1
+            raise
+        for _, seconds in results:
+            self.sentence_latency.record(seconds)
+        return [tagged for tagged, _ in results]
+
+    def worker_memory(self):
+        """Return the memory usage of each worker process (see
+        memory_usage), keyed on process ID. Workers report their IDs as
+        they start (see start_worker), and the pool replaces any that
+        exit, so the ones that are gone are dropped here."""
+        with self.lock:
+            while True:
+                try:
+                    self.pids.add(self.new_pids.get_nowait())
+                except Empty:
+                    break
+            self.pids = set(pid for pid in self.pids if running(pid))
+            pids = sorted(self.pids)
+        return dict((str(pid), memory_usage(pid)) for pid in pids)
+
+    def stats(self):
+        return {"workers": self.workers,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "request_latency": self.request_latency.snapshot(),
+                "sentence_latency": self.sentence_latency.snapshot(),
+                "worker_memory": self.worker_memory()}
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.pool.terminate()
+        self.pool.join()
+
+class TaggingRequestHandler(BaseHTTPRequestHandler):
+    def send_json(self, code, obj):
+        body = json.dumps(obj)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.server.stats())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/tag":
+            return self.send_json(404, {"error": "not found"})
+        try:
+            self.tag_request()
+        except Exception as e:
+            with self.server.lock:
+                self.server.errors += 1
+            self.send_json(500, {"error": "internal error: %s" % e})
+
+    def tag_request(self):
+        start = time.time()
+        try:
+            length = int(self.headers.getheader("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length))
+            sentences = read_sentences(request["sentences"])
+            timeout = min(float(request.get("timeout",
+                                            self.server.default_timeout)),
+                          self.server.default_timeout)
+            if not timeout > 0:
+                raise ValueError("timeout must be positive")
+        except (ValueError, KeyError, TypeError) as e:
+            return self.send_json(400, {"error": "bad request: %s" % e})
+        if len(sentences) > self.server.max_batch:
+            return self.send_json(413, {"error": "batch too large"})
+        try:
+            results = self.server.tag(sentences, timeout)
+        except multiprocessing.TimeoutError:
+            return self.send_json(504, {"error": "timed out"})
+        elapsed = time.time() - start
+        self.server.request_latency.record(elapsed)
+        self.send_json(200, {"results": results, "elapsed": elapsed})
+
+    def log_message(self, format, *args):
+        pass # keep quiet; latencies are in /stats
+
+def serve(port=8765, workers=None, timeout=30.0, max_batch=1000, watch=None,
+          preload=False):
+    server = TaggingServer(("127.0.0.1", port), workers, timeout, max_batch,
+                           watch, preload)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    argparser.add_argument("--port", type=int, default=8765)
+    argparser.add_argument("--workers", type=int, default=None,
+                           help="number of worker processes (default: "
+                                "one per CPU)")
+    argparser.add_argument("--timeout", type=float, default=30.0,
+                           help="maximum seconds to wait for a batch")
+    argparser.add_argument("--max-batch", type=int, default=1000,
+                           help="maximum number of sentences per request")
+    argparser.add_argument("--watch", type=float, default=None,
+                           metavar="SECONDS",
+                           help="check the grammar file for changes every "
+                                "SECONDS seconds, and reload it")
+    argparser.add_argument("--preload", action="store_true",
+                           help="prepare the loaded grammar to be shared "
+                                "by the workers before forking them")
+    args = argparser.parse_args()
+    serve(args.port, args.workers, args.timeout, args.max_batch, args.watch,
+          args.preload)
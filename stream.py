@@ -0,0 +1,289 @@
+"""Streaming interfaces to the timex tagger.
+
+Parsing a sentence can take a while, so callers that must stay responsive
+(an event loop, a network service) shouldn't call timex.parse directly.
+The functions here hand sentences to a pool of worker processes or threads
+instead, keeping only a bounded number of them in flight: the input is read
+no faster than results are consumed, so a fast producer is slowed down to
+the speed of the parser rather than queueing up unbounded work. Results
+are always yielded in input order.
+
+A Pipeline chains several such steps (e.g., reading, tokenizing,
+segmenting, tagging and feature extraction) into stages, each running in
+its own thread or process and connected to the next by a bounded queue,
+so that the stages overlap and a slow one holds back the ones before it.
+Every stage counts the items it has processed and the time it has spent
+on them, and the depth of its input queue shows whether it is keeping up;
+see Pipeline.report, and tml_pipeline for a pipeline over TimeML files."""
+
+import codecs
+import sys
+import threading
+import time
+import traceback
+import multiprocessing
+from collections import deque
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+from Queue import Queue, Empty, Full
+
+def tag_sentence(tokens):
+    """Tag a single sentence, returning a list of tokens and timexes."""
+    # Importing timex reads the grammar, which the rest of this module
+    # doesn't need.
+    import timex
+    return list(timex.parse(tokens))
+
+def bounded_imap(func, iterable, pool, max_in_flight):
+    """Like pool.imap, but never submit more than max_in_flight items ahead
+    of the consumer. Results are yielded in input order."""
+    assert max_in_flight > 0, "max_in_flight must be positive"
+    pending = deque()
+    for item in iterable:
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
+def tag_stream(sentences, pool=None, processes=None, threads=False,
+               max_in_flight=None):
+    """Yield the tagged version of each sentence (a list of tokens) from
+    the given iterable, in order.
+
+    If no pool is given, one is created for the duration of the stream,
+    with the given number of processes (or threads, if threads is true);
+    the default is one per CPU. At most max_in_flight sentences (default:
+    twice the number of processes) are submitted ahead of the consumer."""
+    if pool is None:
+        import timex # read the grammar once, before forking the workers
+        own_pool = (ThreadPool if threads else Pool)(processes)
+        pool = own_pool
+    else:
+        own_pool = None
+    if max_in_flight is None:
+        max_in_flight = 2 * (processes or cpu_count())
+    try:
+        for tagged in bounded_imap(tag_sentence, sentences, pool,
+                                   max_in_flight):
+            yield tagged
+    finally:
+        if own_pool:
+            own_pool.terminate()
+            own_pool.join()
+
+# Staged pipelines.
+
+class PipelineError(Exception):
+    """Raised by Pipeline.run when a stage fails; the message includes the
+    name of the stage and the traceback from its thread or process."""
+
+def put(queue, message, stopped):
+    """Put a message on a bounded queue, waiting for room until the
+    pipeline is stopped. Returns false if it was."""
+    while not stopped.is_set():
+        try:
+            queue.put(message, timeout=0.1)
+            return True
+        except Full:
+            pass
+    return False
+
+def get(queue, stopped):
+    """Get a message from a queue, waiting until the pipeline is stopped.
+    Returns None (the end of the stream) if it was."""
+    while not stopped.is_set():
+        try:
+            return queue.get(timeout=0.1)
+        except Empty:
+            pass
+
+def feed(items, queue, stopped):
+    """Put the items on a pipeline's first queue, followed by the end of
+    the stream. If iterating over the items fails, the error is passed on
+    as though from a failed stage, and the stream is still ended."""
+    try:
+        for item in items:
+            if not put(queue, (True, item), stopped):
+                return
+    except Exception:
+        put(queue, (False, "input failed:\n%s" % traceback.format_exc()),
+            stopped)
+    finally:
+        put(queue, None, stopped)
+
+def run_stage(stage, input, output, stopped):
+    """Apply a stage's function to each item from the input queue, and put
+    the results on the output queue. Messages are pairs (True, item), or
+    (False, error message) for items that failed upstream; None marks the
+    end of the stream."""
+    while True:
+        message = get(input, stopped)
+        if message is None:
+            put(output, None, stopped)
+            return
+        ok, value = message
+        if ok:
+            start = time.time()
+            try:
+                message = (True, stage.func(value))
+            except Exception:
+                message = (False, "stage %s failed:\n%s" %
+                                  (stage.name, traceback.format_exc()))
+            with stage.busy.get_lock():
+                stage.busy.value += time.time() - start
+            with stage.items.get_lock():
+                stage.items.value += 1
+        if not put(output, message, stopped):
+            return
+
+class Stage(object):
+    """A named step of a pipeline: a function of one argument, applied to
+    each item in turn."""
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.items = multiprocessing.Value("l", 0)
+        self.busy = multiprocessing.Value("d", 0.0)
+        self.queue = None # its input queue, while running
+
+    def depth(self):
+        """Return the number of items waiting in the stage's input queue,
+        or None if that isn't known."""
+        try:
+            return self.queue.qsize() if self.queue else 0
+        except NotImplementedError:
+            return None
+
+class Pipeline(object):
+    """A sequence of stages, each of which runs in its own thread (or, if
+    processes is true, its own process), connected by queues that hold at
+    most maxsize items each. Items flow through the stages in order, and
+    come out in the order they went in."""
+
+    def __init__(self, stages, maxsize=16, processes=False):
+        self.stages = [stage if isinstance(stage, Stage) else Stage(*stage)
+                       for stage in stages]
+        self.maxsize = maxsize
+        self.processes = processes
+        self.start = self.end = None
+
+    def run(self, items):
+        """Feed the items through the pipeline, and yield the results. If
+        a stage fails, PipelineError is raised; if the consumer stops
+        early, the stages are stopped too."""
+        if self.processes:
+            queue_class = multiprocessing.Queue
+            worker_class = multiprocessing.Process
+            stopped = multiprocessing.Event()
+        else:
+            queue_class = Queue
+            worker_class = threading.Thread
+            stopped = threading.Event()
+        queues = [queue_class(self.maxsize)
+                  for i in range(len(self.stages) + 1)]
+        workers = []
+        for stage, input, output in zip(self.stages, queues, queues[1:]):
+            stage.queue = input
+            worker = worker_class(target=run_stage,
+                                  args=(stage, input, output, stopped))
+            worker.daemon = True
+            workers.append(worker)
+        feeder = threading.Thread(target=feed,
+                                  args=(items, queues[0], stopped))
+        feeder.daemon = True
+        self.start, self.end = time.time(), None
+        for worker in workers:
+            worker.start()
+        feeder.start()
+        try:
+            while True:
+                message = get(queues[-1], stopped)
+                if message is None:
+                    break
+                ok, value = message
+                if not ok:
+                    raise PipelineError(value)
+                yield value
+        finally:
+            self.end = time.time()
+            stopped.set()
+            for worker in workers:
+                if self.processes and worker.is_alive():
+                    worker.terminate()
+                worker.join()
+            for stage in self.stages:
+                stage.queue = None
+
+    def stats(self):
+        """Return a list of dictionaries, one per stage, with the number of
+        items it has processed, the seconds it has spent processing them,
+        its throughput in items per second of that time, and the depth of
+        its input queue. The slowest stage is the bottleneck; the queues
+        before it tend to be full, and those after it empty."""
+        stats = []
+        for stage in self.stages:
+            items, busy = stage.items.value, stage.busy.value
+            stats.append({"stage": stage.name,
+                          "items": items,
+                          "seconds": busy,
+                          "rate": items / busy if busy else None,
+                          "queue": stage.depth()})
+        return stats
+
+    def report(self, out=None):
+        out = out or codecs.getwriter("UTF-8")(sys.stdout)
+        out.write(u"%-12s %8s %10s %10s %6s\n" %
+                  ("stage", "items", "seconds", "items/s", "queue"))
+        for row in self.stats():
+            out.write(u"%-12s %8d %10.3f %10s %6s\n" %
+                      (row["stage"], row["items"], row["seconds"],
+                       "%.1f" % row["rate"] if row["rate"] else "-",
+                       "-" if row["queue"] is None else row["queue"]))
+        if self.start:
+            out.write(u"%.3f seconds elapsed\n" %
+                      ((self.end or time.time()) - self.start))
+
+# A pipeline over TimeML files: read, tokenize, segment, tag and, if a
+# function is given, extract features. The items passed between stages are
+# plain strings and lists, so that they can be sent between processes.
+
+def read_file(path):
+    with open(path) as f:
+        return f.read()
+
+def tokenize_tml(text):
+    """Return the tokens of a TimeML document, with the TIMEX3 tags
+    replaced by the words they contain."""
+    import xml.dom.minidom
+    from get_tml import expand, flatten, word_tokenize
+    root = xml.dom.minidom.parseString(text).childNodes[0]
+    tokens = []
+    for token in flatten(map(word_tokenize, expand(root))):
+        if isinstance(token, basestring):
+            tokens.append(token)
+        else:
+            tokens.extend(word_tokenize(u"".join(
+                node.data for node in token.childNodes
+                if node.nodeType == node.TEXT_NODE)))
+    return tokens
+
+def segment(tokens):
+    from get_tml import sentence_tokenize
+    return [list(sentence) for sentence in sentence_tokenize(tokens)]
+
+def tag_document(sentences):
+    return [tag_sentence(sentence) for sentence in sentences]
+
+def tml_pipeline(features=None, maxsize=16, processes=False):
+    """Return a pipeline that takes the paths of TimeML files and yields
+    their tagged sentences, or, if a features function is given, what it
+    returns for them."""
+    stages = [("read", read_file),
+              ("tokenize", tokenize_tml),
+              ("segment", segment),
+              ("tag", tag_document)]
+    if features:
+        stages.append(("features", features))
+    return Pipeline(stages, maxsize, processes)
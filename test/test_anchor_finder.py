@@ -0,0 +1,122 @@
+from unittest import *
+
+import anchor_finder
+from anchor_finder import corpus_features, doc_features, classify_many
+
+class Document(object):
+    """A small stand-in for a stripped TimeML document: sentences of tokens,
+    where timexes are dictionaries of TIMEX3 attributes, and the position
+    of each timex."""
+
+    def __init__(self, sentences):
+        self.sentences = sentences
+        self.timexes = [(token["tid"], (x, y))
+                        for x, sentence in enumerate(sentences)
+                        for y, token in enumerate(sentence)
+                        if isinstance(token, dict)]
+
+def timex(tid, type="Year", anchor=None):
+    return {"tid": tid, "type": type, "anchorTimeID": anchor,
+            "beginPoint": None, "endPoint": None}
+
+def token_features(token):
+    if isinstance(token, dict):
+        return {"timex_type": token["type"]}
+    return {"word": token.lower()}
+
+documents = [
+    Document([["In", timex("t1"), ",", "prices", "rose", "."],
+              ["A", timex("t2", "Month", "t1"), "later", ",", "they",
+               "fell", "after", timex("t3", "DayOfWeek", "t2"), "."]]),
+    Document([["Nothing", "happened", "."]]),
+    Document([[timex("t4", "CalendarDate"), "and", timex("t5", "Quarter")],
+              ["Since", timex("t6", "Month", "t4")]]),
+    Document([["On", timex("t7", "DayOfWeek"), "."]]),
+]
+
+class Restrictor(object):
+    """An anchored classifier that predicts that timexes after a word are
+    anchored, counting its calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, features):
+        return "ANCHORED" if "token_-1_word" in features else "UNANCHORED"
+
+    def classify(self, features):
+        self.calls += 1
+        return self.predict(features)
+
+class BatchRestrictor(Restrictor):
+    def classify_many(self, feature_sets):
+        self.calls += 1
+        return map(self.predict, feature_sets)
+
+class CorpusFeaturesTest(TestCase):
+    def setUp(self):
+        self.saved = (anchor_finder.strip_xml, anchor_finder.token_features)
+        anchor_finder.strip_xml = lambda doc: doc
+        anchor_finder.token_features = token_features
+
+    def tearDown(self):
+        anchor_finder.strip_xml, anchor_finder.token_features = self.saved
+
+    def expected(self, restrictor=None):
+        return [pair for doc in documents
+                for pair in doc_features(doc,
+                                         anchored_classifier=restrictor)]
+
+    def test_unchunked(self):
+        """Apply the feature function to each document in turn"""
+        self.assertEqual(corpus_features(documents), self.expected())
+        self.assertEqual(corpus_features(documents,
+                                         lambda doc: [len(doc.timexes)]),
+                         [3, 0, 3, 1])
+
+    def test_chunked(self):
+        """Pair the timexes of chunks of documents as doc_features does"""
+        expected = self.expected()
+        self.failUnless(expected)
+        for chunk_size in (1, 2, 3, 100):
+            self.assertEqual(corpus_features(iter(documents),
+                                             chunk_size=chunk_size),
+                             expected)
+
+    def test_chunked_restrictor(self):
+        """Classify the timexes of each chunk in a single call"""
+        expected = self.expected(Restrictor())
+        self.failIf(expected == self.expected())
+        # Chunks without timexes don't call the classifier at all.
+        for chunk_size, calls in ((1, 3), (2, 2), (100, 1)):
+            restrictor = BatchRestrictor()
+            self.assertEqual(corpus_features(documents,
+                                             restrictor=restrictor,
+                                             chunk_size=chunk_size),
+                             expected)
+            self.assertEqual(restrictor.calls, calls)
+        self.assertEqual(corpus_features(documents, restrictor=Restrictor(),
+                                         chunk_size=2),
+                         expected)
+
+class ClassifyManyTest(TestCase):
+    def test_classify_many(self):
+        """Classify in one call where the classifier supports it"""
+        feature_sets = [{"token_-1_word": "in"}, {}]
+        for cls, calls in ((Restrictor, 2), (BatchRestrictor, 1)):
+            classifier = cls()
+            self.assertEqual(classify_many(classifier, feature_sets),
+                             ["ANCHORED", "UNANCHORED"])
+            self.assertEqual(classifier.calls, calls)
+            self.assertEqual(classify_many(classifier, []), [])
+            self.assertEqual(classifier.calls, calls)
+
+def suite():
+    return TestSuite([TestLoader().loadTestsFromTestCase(cls) \
+                          for cls in (CorpusFeaturesTest, ClassifyManyTest)])
+
+def run(runner=TextTestRunner, **args):
+    return runner(**args).run(suite())
+
+if __name__ == "__main__":
+    run(verbosity=2)
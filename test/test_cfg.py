@@ -65,12 +65,87 @@ class TestAbbrev(TestCase):
         self.assertFalse(self.abbrev.match("fooq"))
         self.assertFalse(self.abbrev.match("foobarbaz"))
 
+class TestGrammarUpdate(TestCase):
+    def setUp(self):
+        self.a = Production("A", [Literal("a")])
+        self.b = Production("B", ["A", Literal("b")])
+        self.grammar = AttributeGrammar([(self.a, lambda _: 1), self.b], "B")
+
+    def test_add(self):
+        """Add a production to a grammar"""
+        rule = Production("A", [])
+        self.assertEqual(self.grammar.nullable(), {})
+        self.assertEqual(self.grammar.add_production(rule, lambda _: 2), 2)
+        self.assertEqual(self.grammar["A"], [self.a, rule])
+        self.assertEqual(self.grammar.nullable(), {"A": rule})
+        self.assertEqual(self.grammar.action(rule)([]), 2)
+
+    def test_remove(self):
+        """Remove a production from a grammar"""
+        self.assertEqual(self.grammar.remove_production(self.a), 0)
+        self.assertEqual(self.grammar.rules, [None, self.b])
+        self.assertEqual(self.grammar["A"], [])
+        self.assertEqual(self.grammar.action(self.a), default_action)
+        self.assertRaises(ValueError,
+                          lambda: self.grammar.remove_production(self.a))
+
+    def test_remove_nullable(self):
+        """Remove the only empty production for a nonterminal"""
+        rule = Production("A", [])
+        self.grammar.add_production(rule)
+        self.assertEqual(self.grammar.nullable(), {"A": rule})
+        self.grammar.remove_production(rule)
+        self.assertEqual(self.grammar.nullable(), {})
+
+class TestLongestYield(TestCase):
+    def setUp(self):
+        # S -> D "x" | L; D -> "d" "d" | ; L -> "l" L | "l" "l" "l" M;
+        # M -> "m" N | "m"; N -> M "n"
+        x, d, l, m, n = map(Literal, "xdlmn")
+        self.grammar = Grammar([Production("S", ["D", x]),
+                                Production("S", ["L"]),
+                                Production("D", [d, d]),
+                                Production("D", []),
+                                Production("L", [l, "L"]),
+                                Production("L", [l, l, l, "M"]),
+                                Production("M", [m, "N"]),
+                                Production("M", [m]),
+                                Production("N", ["M", n])])
+
+    def test_components(self):
+        """Find the strongly connected components of a grammar"""
+        components = self.grammar.components()
+        self.assertEqual(sorted(map(sorted, components)),
+                         [["D"], ["L"], ["M", "N"], ["S"]])
+        order = dict((x, i) for i, c in enumerate(components) for x in c)
+        self.failUnless(order["M"] < order["L"] < order["S"])
+        self.failUnless(order["D"] < order["S"])
+
+    def test_longest_yield(self):
+        """Find the longest non-recursive yield of each nonterminal"""
+        self.assertEqual(self.grammar.longest_yield("D"), 2)
+        self.assertEqual(self.grammar.longest_yield("M"), 1)
+        self.assertEqual(self.grammar.longest_yield("N"), 0)
+        self.assertEqual(self.grammar.longest_yield("L"), 4)
+        self.assertEqual(self.grammar.longest_yield(), 4)
+
+    def test_update(self):
+        """Recompute the longest yields when the grammar changes"""
+        self.assertEqual(self.grammar.longest_yield(), 4)
+        rule = Production("S", ["D", "D", "D"])
+        self.grammar.add_production(rule)
+        self.assertEqual(self.grammar.longest_yield(), 6)
+        self.grammar.remove_production(rule)
+        self.assertEqual(self.grammar.longest_yield(), 4)
+
 def suite():
     return TestSuite([TestLoader().loadTestsFromTestCase(cls) \
                           for cls in (TestLiteral,
                                       TestRegexp,
                                       TestAcronym,
-                                      TestAbbrev)])
+                                      TestAbbrev,
+                                      TestGrammarUpdate,
+                                      TestLongestYield)])
 
 def run(runner=TextTestRunner, **args):
     return runner(**args).run(suite())
@@ -1,7 +1,10 @@
+import pickle
+import time
 from unittest import *
 
 from cfg import Grammar, Literal, Production, ParseTree
-from earley import State, Parser
+from earley import State, Parser, ParseTables, \
+    longest_span, fewest_rules, ProductionWeights
 
 class TestState(TestCase):
     def setUp(self):
@@ -60,9 +63,229 @@ class TestParser(TestCase):
         self.parser.parse("aa")
         self.failIf(list(self.parser.parses()))
 
+    def test_stats(self):
+        """Collect parser statistics"""
+        stats = {}
+        self.parser.parse("ab", stats)
+        self.assertEqual(stats["parses"], 1)
+        self.assertEqual(stats["tokens"], 2)
+        self.assertEqual(stats["columns"], [2, 1, 2])
+        self.assertEqual(stats["predicted"], 1)
+        self.assertEqual(stats["scan_calls"], 2)
+        self.assertEqual(stats["scanned"], 2)
+        self.assertEqual(stats["completed"], 1)
+        self.parser.parse("ab", stats)
+        self.assertEqual(stats["parses"], 2)
+        self.assertEqual(len(stats["columns"]), 6)
+
+class TestNullable(TestCase):
+    def setUp(self):
+        self.grammar = Grammar([Production("S", ["A", "A", Literal("b")]),
+                                Production("A", ["B"]),
+                                Production("A", [Literal("a")]),
+                                Production("B", [])])
+
+    def test_nullable(self):
+        """Find nullable nonterminals and their empty productions"""
+        nullable = self.grammar.nullable()
+        self.assertEqual(sorted(nullable), ["A", "B"])
+        self.assertEqual(nullable["A"], Production("A", ["B"]))
+
+    def test_empty_derivations(self):
+        """Parse with several consecutive empty derivations"""
+        for tables in (None, ParseTables(self.grammar)):
+            for input, n in (("b", 1), ("ab", 2), ("aab", 1)):
+                parser = Parser(self.grammar, tables)
+                parser.parse(input)
+                parses = list(parser.parses())
+                self.assertEqual(len(parses), n)
+                for parse in parses:
+                    self.assertEqual(list(parse.leaves()), list(input))
+            parser = Parser(self.grammar, tables)
+            parser.parse("aaab")
+            self.failIf(list(parser.parses()))
+
+    def test_spans(self):
+        """Record the span of each node in a parse tree"""
+        parser = Parser(self.grammar)
+        parser.parse("aab")
+        tree = parser.parses().next()
+        self.assertEqual((tree.start, tree.end), (0, 3))
+        self.assertEqual([(child.start, child.end) for child in tree[:2]],
+                         [(0, 1), (1, 2)])
+        parser.parse("b")
+        tree = parser.parses().next()
+        self.assertEqual([(child.start, child.end) for child in tree[:2]],
+                         [(0, 0), (0, 0)])
+        self.assertEqual((tree[0][0].start, tree[0][0].end), (0, 0))
+
+class TestLeo(TestCase):
+    def setUp(self):
+        self.grammar = Grammar([Production("S", ["L"]),
+                                Production("L", [Literal("x"), "L"]),
+                                Production("L", [Literal("x")])])
+
+    def parse(self, input, leo):
+        parser = Parser(self.grammar, leo=leo)
+        parser.parse(input)
+        return parser
+
+    def test_right_recursion(self):
+        """Parse a right-recursive grammar in linear space"""
+        input = "x" * 50
+        plain = self.parse(input, False)
+        leo = self.parse(input, True)
+        self.assertEqual(list(leo.parses()), list(plain.parses()))
+        self.failUnless(len(leo.chart[-1]) < 10)
+        self.failUnless(len(plain.chart[-1]) > 50)
+
+    def test_deep_right_recursion(self):
+        """Build the parse tree below a long reduction path"""
+        parses = list(self.parse("x" * 400, True).parses())
+        self.assertEqual(len(parses), 400)
+        self.assertEqual(len(list(parses[0].leaves())), 400)
+
+class TestBudget(TestCase):
+    def setUp(self):
+        self.grammar = Grammar([Production("S", ["L"]),
+                                Production("L", [Literal("x"), "L"]),
+                                Production("L", [Literal("x")])])
+        self.parser = Parser(self.grammar)
+
+    def test_unlimited(self):
+        """Parse the whole input within a generous budget"""
+        self.parser.parse("x" * 10, deadline=time.time() + 60,
+                          max_states=10000)
+        self.assertEqual(self.parser.truncated, None)
+        self.assertEqual(self.parser.final_states().next()[0], 10)
+
+    def test_max_states(self):
+        """Stop parsing when the chart gets too big"""
+        stats = {}
+        self.parser.parse("x" * 50, stats, max_states=100)
+        n = self.parser.truncated
+        self.failUnless(0 < n < 50)
+        self.assertEqual(len(self.parser), n + 1)
+        self.assertEqual([i for i, state in self.parser.final_states()],
+                         range(n, 0, -1))
+        self.assertEqual(stats["truncated"], 1)
+        self.assertEqual(stats["tokens"], n)
+
+    def test_deadline(self):
+        """Stop parsing when time is up"""
+        self.parser.parse("x" * 10, deadline=time.time() - 1)
+        self.assertEqual(self.parser.truncated, 0)
+        self.failIf(list(self.parser.parses()))
+        self.parser.parse("x" * 10)
+        self.assertEqual(self.parser.truncated, None)
+
+class TestParseTables(TestCase):
+    def setUp(self):
+        self.grammar = Grammar([Production("S", ["A", "B"]),
+                                Production("A", ["C", Literal("a")]),
+                                Production("A", []),
+                                Production("B", [Literal("b")]),
+                                Production("C", [Literal("c")])])
+        self.tables = ParseTables(self.grammar)
+
+    def test_nullable(self):
+        """Find the nullable nonterminals"""
+        self.assertEqual(self.tables.nullable, frozenset(["A"]))
+
+    def test_closure(self):
+        """Compute prediction closures past nullable prefixes"""
+        self.assertEqual(self.tables.closures["S"],
+                         (("S", "A", "B", "C"), (0, 1, 2, 3, 4)))
+        self.assertEqual(self.tables.closures["A"], (("A", "C"), (1, 2, 4)))
+        self.assertEqual(self.tables.closures["B"], (("B",), (3,)))
+
+    def test_pickle(self):
+        """Pickle parse tables and use them with the grammar"""
+        self.tables.bind(self.grammar)
+        tables = pickle.loads(pickle.dumps(self.tables))
+        self.assertEqual(tables.closures, self.tables.closures)
+        parser = Parser(self.grammar, tables)
+        parser.parse("cab")
+        self.assertEqual(len(list(parser.parses())), 1)
+
+    def test_parse(self):
+        """Parse with and without tables"""
+        rule = Production("S", [Literal("a"), Literal("b")])
+        grammar = Grammar([rule])
+        parser = Parser(grammar, ParseTables(grammar))
+        parser.parse("ab")
+        self.assertEqual(list(parser.parses()), [ParseTree(rule, "ab")])
+        parser.parse("aa")
+        self.failIf(list(parser.parses()))
+
+    def test_update(self):
+        """Update the tables incrementally as the grammar changes"""
+        rules = [Production("B", [Literal("d")]),
+                 Production("D", [Literal("d")]),
+                 Production("C", ["D"])]
+        for rule in rules:
+            self.grammar.add_production(rule)
+        self.tables.update(self.grammar, rules)
+        self.assertEqual(self.tables.closures,
+                         ParseTables(self.grammar).closures)
+        self.assertEqual(self.tables.closures["A"],
+                         (("A", "C", "D"), (1, 2, 4, 7, 6)))
+
+        empty = self.grammar["A"][1]
+        self.grammar.remove_production(empty)
+        self.tables.update(self.grammar, [empty])
+        self.assertEqual(self.tables.nullable, frozenset())
+        self.assertEqual(self.tables.closures,
+                         ParseTables(self.grammar).closures)
+
+        parser = Parser(self.grammar, self.tables)
+        parser.parse("dad")
+        self.assertEqual(len(list(parser.parses())), 1)
+        parser.parse("b")
+        self.failIf(list(parser.parses()))
+
+class TestKBest(TestCase):
+    def setUp(self):
+        self.flat = Production("S", ["A"])
+        self.deep = Production("S", ["B", "C"])
+        self.grammar = Grammar([self.flat, self.deep,
+                                Production("A", [Literal("a"), Literal("b")]),
+                                Production("B", [Literal("a")]),
+                                Production("C", [Literal("b")])])
+        self.parser = Parser(self.grammar)
+        self.parser.parse("ab")
+
+    def best(self, k=None, score=None):
+        return [tree.node for tree in self.parser.kbest(k, score)]
+
+    def test_longest(self):
+        """Order parses by length, then chart order"""
+        self.parser.parse("aba")
+        self.assertEqual(list(self.parser.best_states()),
+                         list(self.parser.final_states()))
+
+    def test_fewest_rules(self):
+        """Prefer parses with fewer rules"""
+        self.assertEqual(self.best(score=fewest_rules),
+                         [self.flat, self.deep])
+        self.assertEqual(self.best(1, fewest_rules), [self.flat])
+
+    def test_weights(self):
+        """Prefer parses with less total weight"""
+        weights = ProductionWeights({self.flat: 3, self.deep: 1})
+        self.assertEqual(self.best(score=weights), [self.deep, self.flat])
+        combined = lambda i, state, memo: (longest_span(i, state, memo),
+                                           weights(i, state, memo),
+                                           fewest_rules(i, state, memo))
+        self.assertEqual(self.best(1, combined), [self.deep])
+        trees = list(self.parser.kbest(1, combined))
+        self.assertEqual((trees[0].start, trees[0].end), (0, 2))
+
 def suite():
     return TestSuite([TestLoader().loadTestsFromTestCase(cls) \
-                          for cls in TestState, TestParser])
+                          for cls in (TestState, TestParser,
+                                      TestNullable, TestLeo, TestBudget,
+                                      TestParseTables, TestKBest)])
 
 def run(runner=TextTestRunner, **args):
     return runner(**args).run(suite())
@@ -1,8 +1,12 @@
+import os
+import tempfile
+import time
 from types import FunctionType
 from unittest import *
 
-from earley import Parser
-from grammarparser import compile_action, parse_grammar_spec
+from earley import Parser, ParseTables
+from grammarparser import *
+from grammarparser import compile_action
 
 class CompileActionTest(TestCase):
     def test_expression(self):
@@ -186,12 +190,204 @@ class ParseNumberTest(TestCase):
         self.assertNumber("twenty o six", 2006)
         self.assertNumber("twenty ten", 2010)
 
+# Optional elements, given as empty alternatives.
+optional_grammar = """
+phrase -> opt_the noun opt_comma { (_[0], _[1], _[2]) }
+opt_the -> "the" | { None }
+noun -> "dog" | "cat"
+opt_comma -> "," | { None }
+"""
+def parse_optional(phrase, grammar=parse_grammar_spec(optional_grammar,
+                                                      "phrase")):
+    parser = Parser(grammar)
+    parser.parse(phrase.split())
+    return parser.grammar.eval(parser.parses().next())
+
+class ParseOptionalTest(TestCase):
+    def test_optional(self):
+        """Parse with empty alternatives"""
+        self.assertEqual(parse_optional("dog"), (None, "dog", None))
+        self.assertEqual(parse_optional("the dog"), ("the", "dog", None))
+        self.assertEqual(parse_optional("cat ,"), (None, "cat", ","))
+        self.assertEqual(parse_optional("the cat ,"), ("the", "cat", ","))
+        self.assertRaises(StopIteration, lambda: parse_optional("the"))
+
+class FastParseTest(TestCase):
+    def parse_all(self, grammar, tokens, tables=None, leo=False):
+        parser = Parser(grammar, tables, leo)
+        parser.parse(tokens)
+        return [parser.grammar.eval(parse) for parse in parser.parses()]
+
+    def assertSameParses(self, spec, start, inputs):
+        grammar = parse_grammar_spec(spec, start)
+        tables = ParseTables(grammar)
+        for tokens in inputs:
+            expected = sorted(self.parse_all(grammar, tokens))
+            self.assertEqual(sorted(self.parse_all(grammar, tokens, tables)),
+                             expected)
+            self.assertEqual(sorted(self.parse_all(grammar, tokens,
+                                                   leo=True)),
+                             expected)
+            self.assertEqual(sorted(self.evaluate_all(grammar, tokens)),
+                             expected)
+            self.assertEqual(sorted(self.evaluate_all(grammar, tokens,
+                                                      leo=True)),
+                             expected)
+
+    def evaluate_all(self, grammar, tokens, leo=False):
+        parser = Parser(grammar, leo=leo)
+        parser.parse(tokens)
+        return [parser.evaluate(state) for i, state in parser.final_states()]
+
+    def test_expr(self):
+        """Parse arithmetic expressions with tables and Leo items"""
+        self.assertSameParses(arith_expr_grammar, "P",
+                              ["2+3*4", ["20", "+", "5"], "2+", "1*2*3"])
+
+    def test_sentence(self):
+        """Parse an ambiguous sentence with tables and Leo items"""
+        self.assertSameParses(sentence_grammar, "S",
+                              ["John called Sue from Denver".split()])
+
+    def test_deep(self):
+        """Evaluate a deep derivation without recursion"""
+        grammar = parse_grammar_spec("""
+L -> "x" L { _[1] + 1 }
+   | "x" { 1 }
+""", "L")
+        parser = Parser(grammar, leo=True)
+        parser.parse("x" * 5000)
+        i, state = parser.final_states().next()
+        self.assertEqual(i, 5000)
+        self.assertEqual(parser.evaluate(state), 5000)
+
+    def test_number(self):
+        """Parse numbers with tables and Leo items"""
+        self.assertSameParses(number_grammar, "number",
+                              [s.split() for s in ("one hundred and twelve",
+                                                   "nineteen ninety-nine",
+                                                   "four hundred thousand "
+                                                   "nine hundred and one")])
+
+class LoadGrammarSpecTest(TestCase):
+    def assertSameGrammar(self, spec, start, inputs):
+        expected = parse_grammar_spec(spec, start)
+        grammar = load_grammar_spec(spec, start)
+        self.assertEqual([unicode(rule) for rule in grammar.rules],
+                         [unicode(rule) for rule in expected.rules])
+        for tokens in inputs:
+            self.assertEqual(self.parse_all(grammar, tokens),
+                             self.parse_all(expected, tokens))
+
+    def parse_all(self, grammar, tokens):
+        parser = Parser(grammar)
+        parser.parse(tokens)
+        return [parser.grammar.eval(parse) for parse in parser.parses()]
+
+    def test_same_grammar(self):
+        """Load the same grammars as the Earley meta-parser"""
+        self.assertSameGrammar(arith_expr_grammar, "P", ["2+3*4"])
+        self.assertSameGrammar(sentence_grammar, "S",
+                               ["John called Sue from Denver".split()])
+        self.assertSameGrammar(number_grammar, "number",
+                               ["nineteen ninety-nine".split()])
+        self.assertSameGrammar(optional_grammar, "phrase",
+                               ["the cat ,".split()])
+
+    def test_no_final_newline(self):
+        """Load a specification without a final newline"""
+        grammar = load_grammar_spec('S -> "a" S { _[1] + 1 } | { 0 }', "S")
+        self.assertEqual([unicode(rule) for rule in grammar.rules],
+                         [u"S \u2192 a S", u"S \u2192 "])
+
+    def assertSyntaxError(self, spec, lineno):
+        try:
+            load_grammar_spec(spec, "S")
+        except GrammarSpecError as e:
+            self.assertEqual(e.lineno, lineno)
+            self.assertEqual(e.filename, "<grammar>")
+        else:
+            self.fail("no syntax error")
+
+    def test_syntax_errors(self):
+        """Report syntax errors with line numbers"""
+        self.assertSyntaxError('S -> "a"\nT > "b"\n', 2)
+        self.assertSyntaxError('S -> "a"\nT ->\n', 2)
+        self.assertSyntaxError('S -> "a"\n\nT -> "b" |\n', 3)
+        self.assertSyntaxError('S -> "a" [1]\n', 1)
+
+    def test_malformed_specs(self):
+        """Report tokenizer and evaluation errors with line numbers"""
+        self.assertSyntaxError('S -> "a"\nT -> "b" { 1 +\n\n', 2)
+        self.assertSyntaxError('S -> "a"\nT -> "b" )\n', 2)
+        self.assertSyntaxError('S -> "a"\n\nT -> "b" { f(1)) }\n', 3)
+        self.assertSyntaxError('S -> "a"\nT -> Foo("x")\n', 2)
+        self.assertSyntaxError('S -> "a"\nT -> "b" { 1 + }\n', 2)
+
+class GrammarHandleTest(TestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(".txt")
+        os.close(fd)
+        self.write('S -> "a" { 1 }\n')
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def write(self, spec):
+        with open(self.filename, "w") as f:
+            f.write(spec)
+
+    def parse(self, grammar, tokens):
+        parser = Parser(grammar)
+        parser.parse(tokens)
+        return parser.grammar.eval(parser.parses().next())
+
+    def test_reload(self):
+        """Reload a changed grammar file"""
+        handle = GrammarHandle(self.filename, "S", tables=True)
+        old, tables = handle.get()
+        self.failUnless(tables)
+        self.assertFalse(handle.check())
+        self.write('S -> "a" { 2 }\n   | "b" { 3 }\n')
+        self.failUnless(handle.check())
+        self.assertEqual(self.parse(handle.grammar, ["a"]), 2)
+        self.assertEqual(self.parse(handle.grammar, ["b"]), 3)
+        self.assertEqual(self.parse(old, ["a"]), 1)
+
+    def test_bad_reload(self):
+        """Keep the current grammar if the file can't be loaded"""
+        handle = GrammarHandle(self.filename, "S")
+        grammar = handle.grammar
+        self.write('S -> "a" { 2 }\nS "b"\n')
+        self.assertFalse(handle.check())
+        self.failUnless(isinstance(handle.error, GrammarSpecError))
+        self.failUnless(handle.grammar is grammar)
+        self.assertRaises(GrammarSpecError, handle.reload)
+
+    def test_watch(self):
+        """Watch a grammar file for changes"""
+        handle = GrammarHandle(self.filename, "S")
+        handle.watch(0.01)
+        try:
+            self.write('S -> "a" { 2 } | "b" { 3 } | "c" { 4 }\n')
+            for i in range(500):
+                if len(handle.grammar.rules) == 3:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(self.parse(handle.grammar, ["c"]), 4)
+        finally:
+            handle.unwatch()
+
 def suite():
     return TestSuite([TestLoader().loadTestsFromTestCase(cls) \
                           for cls in (CompileActionTest,
                                       ParseExprTest,
                                       ParseSentenceTest,
-                                      ParseNumberTest)])
+                                      ParseNumberTest,
+                                      ParseOptionalTest,
+                                      FastParseTest,
+                                      LoadGrammarSpecTest,
+                                      GrammarHandleTest)])
 
 def run(runner=TextTestRunner, **args):
     return runner(**args).run(suite())
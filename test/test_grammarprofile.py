@@ -0,0 +1,55 @@
+# -*- mode: Python; coding: utf-8 -*-
+from unittest import *
+
+from grammarparser import parse_grammar_spec
+from grammarprofile import GrammarProfile, profile
+
+spec = """
+S -> "a" B { _ }
+    | "a" C { _ }
+B -> "b"
+C -> "c"
+"""
+grammar = parse_grammar_spec(spec, "S")
+
+class ProfileTest(TestCase):
+    def setUp(self):
+        self.profile = profile(grammar, [["a", "b"], ["x"]])
+
+    def counts(self, rows):
+        return dict((unicode(name), tuple(counts)) for name, counts in rows)
+
+    def test_rules(self):
+        """Count predicted, advanced, completed and used states per rule"""
+        counts = self.counts(self.profile.rules())
+        self.assertEqual(counts[u"S → a B"], (2, 2, 1, 1))
+        self.assertEqual(counts[u"S → a C"], (2, 1, 0, 0))
+        self.assertEqual(counts[u"B → b"], (1, 1, 1, 1))
+        self.assertEqual(counts[u"C → c"], (1, 0, 0, 0))
+
+    def test_rule_order(self):
+        """List the rules in grammar order, without removed ones"""
+        self.assertEqual([unicode(rule) for rule, _ in self.profile.rules()],
+                         [u"S → a B", u"S → a C", u"B → b", u"C → c"])
+        g = parse_grammar_spec(spec, "S")
+        g.remove_production(g.rules[1])
+        self.assertEqual([unicode(rule)
+                          for rule, _ in GrammarProfile(g).rules()],
+                         [u"S → a B", u"B → b", u"C → c"])
+
+    def test_nonterminals(self):
+        """Sum the counts per nonterminal, sorted by a column"""
+        rows = self.profile.nonterminals("predicted")
+        self.assertEqual(rows[0], ("S", [4, 3, 1, 1]))
+        self.assertEqual(self.counts(rows)["C"], (1, 0, 0, 0))
+        self.assertEqual([name for name, _ in self.profile.nonterminals()],
+                         ["S", "B", "C"])
+
+def suite():
+    return TestSuite([TestLoader().loadTestsFromTestCase(ProfileTest)])
+
+def run(runner=TextTestRunner, **args):
+    return runner(**args).run(suite())
+
+if __name__ == "__main__":
+    run(verbosity=2)
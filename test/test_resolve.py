@@ -0,0 +1,110 @@
+from datetime import date
+from unittest import *
+
+from iso8601.iso8601 import Year, Month, Day
+from resolve import *
+from timex import parse, Increment, Decrement, UtteranceTime
+
+def timex(phrase):
+    """Parse a phrase that consists of a single timex."""
+    [value] = parse(phrase.split())
+    return value
+
+class CalendarTest(TestCase):
+    def test_month_overflow(self):
+        """Carry months past December into the next year"""
+        self.assertEqual(add_months(date(2011, 12, 15), 1), date(2012, 1, 15))
+        self.assertEqual(add_months(date(2011, 11, 30), 14),
+                         date(2013, 1, 30))
+        self.assertEqual(add(date(2011, 10, 1), "Quarter", 1),
+                         date(2012, 1, 1))
+
+    def test_month_underflow(self):
+        """Borrow months before January from the previous year"""
+        self.assertEqual(add_months(date(2012, 1, 31), -1), date(2011, 12, 31))
+        self.assertEqual(add_months(date(2012, 2, 10), -14),
+                         date(2010, 12, 10))
+        self.assertEqual(add(date(2012, 3, 1), "Year", -1), date(2011, 3, 1))
+
+    def test_month_end(self):
+        """Clip the day to the end of a shorter month"""
+        self.assertEqual(add_months(date(2011, 1, 31), 1), date(2011, 2, 28))
+        self.assertEqual(add_months(date(2011, 3, 31), -1), date(2011, 2, 28))
+        self.assertEqual(add_months(date(2011, 12, 31), 3), date(2012, 3, 31))
+        self.assertEqual(add_months(date(2011, 12, 31), 4), date(2012, 4, 30))
+
+    def test_leap_day(self):
+        """Keep February 29 in leap years, and clip it in others"""
+        self.assertEqual(add_months(date(2012, 1, 31), 1), date(2012, 2, 29))
+        self.assertEqual(add_months(date(2012, 2, 29), 12), date(2013, 2, 28))
+        self.assertEqual(add_months(date(2012, 2, 29), 48), date(2016, 2, 29))
+        self.assertEqual(add_months(date(2000, 3, 29), -1), date(2000, 2, 29))
+        self.assertEqual(add_months(date(1900, 3, 29), -1), date(1900, 2, 28))
+        self.assertEqual(add_days(date(2012, 2, 28), 1), date(2012, 2, 29))
+        self.assertEqual(add_days(date(2012, 3, 1), -1), date(2012, 2, 29))
+        self.assertEqual(add_days(date(2011, 3, 1), -1), date(2011, 2, 28))
+
+class ResolverTest(TestCase):
+    def setUp(self):
+        self.resolver = Resolver()
+
+    def resolve(self, timex, anchor, reference=None):
+        return self.resolver.resolve(timex, anchor, reference)
+
+    def test_year_boundaries(self):
+        """Resolve relative months and days across year boundaries"""
+        self.assertEqual(self.resolve(Increment(Month)(UtteranceTime()),
+                                      date(2011, 12, 15)), "2012-01")
+        self.assertEqual(self.resolve(Decrement(Month)(UtteranceTime()),
+                                      date(2012, 1, 10)), "2011-12")
+        self.assertEqual(self.resolve(Decrement(Day)(UtteranceTime()),
+                                      "2012-01-01"), "2011-12-31")
+        self.assertEqual(self.resolve(timex("3 months ago"), "2012-02-10"),
+                         "2011-11")
+
+    def test_leap_day(self):
+        """Resolve timexes anchored on and around February 29"""
+        self.assertEqual(self.resolve(Decrement(Day)(UtteranceTime()),
+                                      date(2012, 3, 1)), "2012-02-29")
+        self.assertEqual(self.resolve(Decrement(Year)(UtteranceTime()),
+                                      date(2012, 2, 29)), "2011")
+        self.assertEqual(self.resolve(Increment(Day)(UtteranceTime()),
+                                      date(2012, 2, 28)), "2012-02-29")
+        self.assertEqual(self.resolve(Increment(Day)(UtteranceTime()),
+                                      date(2011, 2, 28)), "2011-03-01")
+
+    def test_memo(self):
+        """Resolve each timex only once per anchor and reference time"""
+        last_month = Decrement(Month)(UtteranceTime())
+        self.assertEqual(self.resolve(last_month, "2012-01-10"), "2011-12")
+        self.assertEqual(self.resolver.hits, 0)
+        self.assertEqual(self.resolve(last_month, date(2012, 1, 10)),
+                         "2011-12")
+        self.assertEqual(self.resolver.hits, 1)
+        self.assertEqual(self.resolve(last_month, date(2012, 2, 10)),
+                         "2012-01")
+        self.assertEqual(self.resolve(last_month, date(2012, 1, 10),
+                                      date(2012, 2, 10)), "2011-12")
+        self.assertEqual(self.resolver.hits, 1)
+        self.assertEqual(len(self.resolver.memo), 3)
+
+    def test_memo_structure(self):
+        """Share memo entries between timexes built the same way"""
+        self.assertEqual(self.resolve(timex("two weeks ago"), "2012-01-04"),
+                         "2011-W51")
+        self.assertEqual(self.resolve(timex("two weeks ago"), "2012-01-04"),
+                         "2011-W51")
+        self.assertEqual(self.resolver.hits, 1)
+        self.assertEqual(resolve_batch([timex("last month")] * 3,
+                                       ["2012-01-10"] * 3),
+                         ["2011-12"] * 3)
+
+def suite():
+    return TestSuite([TestLoader().loadTestsFromTestCase(cls) \
+                          for cls in (CalendarTest, ResolverTest)])
+
+def run(runner=TextTestRunner, **args):
+    return runner(**args).run(suite())
+
+if __name__ == "__main__":
+    run(verbosity=2)
@@ -0,0 +1,125 @@
+import json
+import multiprocessing
+import subprocess
+import threading
+import urllib2
+from unittest import *
+
+from server import TaggingServer
+
+class TaggingServerTest(TestCase):
+    def setUp(self):
+        self.server = TaggingServer(("127.0.0.1", 0), 2, timeout=10.0,
+                                    max_batch=3)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, path, body=None):
+        """Send a request, and return its status and decoded response."""
+        if body is not None and not isinstance(body, basestring):
+            body = json.dumps(body)
+        try:
+            response = urllib2.urlopen(self.url + path, body)
+        except urllib2.HTTPError as e:
+            response = e
+        return response.code, json.loads(response.read())
+
+    def test_tag(self):
+        """Tag a batch of strings and token lists"""
+        code, response = self.request("/tag", {"sentences": [
+            "He left April 29th 2000 .", ["last", "week"], ""]})
+        self.assertEqual(code, 200)
+        first, second, third = response["results"]
+        self.assertEqual(first[:2], ["He", "left"])
+        self.assertEqual(first[2]["type"], "CalendarDate")
+        self.assertEqual(first[2]["tokens"], 3)
+        self.assertEqual(first[3], ".")
+        self.assertEqual(second[0]["type"], "Decrement")
+        self.assertEqual(second[0]["value"],
+                         "Decrement(Week, UtteranceTime())")
+        self.assertEqual(second[0]["args"][1]["type"], "UtteranceTime")
+        self.assertEqual(third, [])
+
+    def test_stats(self):
+        """Report latencies and counters"""
+        self.request("/tag", {"sentences": ["last week", "today"]})
+        code, stats = self.request("/stats")
+        self.assertEqual(code, 200)
+        self.assertEqual(stats["workers"], 2)
+        self.assertEqual(stats["request_latency"]["count"], 1)
+        self.assertEqual(stats["sentence_latency"]["count"], 2)
+        self.assertEqual((stats["timeouts"], stats["errors"]), (0, 0))
+
+    def test_worker_memory(self):
+        """Report the memory of each worker, and drop the ones that exit"""
+        workers = set(str(process.pid)
+                      for process in multiprocessing.active_children())
+        code, stats = self.request("/stats")
+        memory = stats["worker_memory"]
+        self.assertEqual(len(memory), 2)
+        self.failUnless(set(memory) <= workers)
+        for usage in memory.values():
+            if usage is not None: # only on Linux
+                self.assertEqual(sorted(usage), ["private", "rss", "shared"])
+                self.failUnless(usage["rss"] > 0)
+        exited = subprocess.Popen(["true"])
+        exited.wait()
+        self.server.pids.add(exited.pid)
+        self.assertEqual(sorted(self.request("/stats")[1]["worker_memory"]),
+                         sorted(memory))
+
+    def test_bad_request(self):
+        """Reject malformed requests"""
+        for body in ("{", {}, {"sentences": "last week"},
+                     {"sentences": [["last", 7]]},
+                     {"sentences": ["today"], "timeout": 0},
+                     {"sentences": ["today"], "timeout": -1},
+                     {"sentences": ["today"], "timeout": "soon"}):
+            code, response = self.request("/tag", body)
+            self.assertEqual(code, 400, body)
+            self.failUnless(response["error"].startswith("bad request"))
+
+    def test_not_found(self):
+        """Answer 404 for unknown paths"""
+        self.assertEqual(self.request("/tags", {"sentences": []})[0], 404)
+        self.assertEqual(self.request("/")[0], 404)
+
+    def test_batch_too_large(self):
+        """Refuse batches larger than the maximum"""
+        code, _ = self.request("/tag", {"sentences": ["today"] * 4})
+        self.assertEqual(code, 413)
+
+    def test_internal_error(self):
+        """Answer 500 with a JSON error, and count it"""
+        def fail(sentences, timeout):
+            raise RuntimeError("no workers")
+        self.server.tag = fail
+        code, response = self.request("/tag", {"sentences": ["today"]})
+        self.assertEqual(code, 500)
+        self.failUnless("no workers" in response["error"])
+        self.assertEqual(self.server.errors, 1)
+
+    def test_timeout(self):
+        """Time out a batch that can't be tagged in time"""
+        sentence = "last week and April 29th 2000 and two weeks ago " * 40
+        code, response = self.request("/tag", {"sentences": [sentence] * 3,
+                                               "timeout": 0.01})
+        self.assertEqual(code, 504)
+        self.assertEqual(self.server.timeouts, 1)
+        code, response = self.request("/tag", {"sentences": ["last week"]})
+        self.assertEqual(code, 200)
+
+def suite():
+    return TestSuite([TestLoader().loadTestsFromTestCase(TaggingServerTest)])
+
+def run(runner=TextTestRunner, **args):
+    return runner(**args).run(suite())
+
+if __name__ == "__main__":
+    run(verbosity=2)
@@ -0,0 +1,109 @@
+import time
+from multiprocessing.pool import ThreadPool
+from unittest import *
+
+from stream import bounded_imap, tag_stream, Pipeline, PipelineError
+
+class BoundedImapTest(TestCase):
+    def setUp(self):
+        self.pool = ThreadPool(2)
+
+    def tearDown(self):
+        self.pool.terminate()
+
+    def test_order(self):
+        """Yield results in input order"""
+        self.assertEqual(list(bounded_imap(len, ["a", "bb", "ccc"],
+                                           self.pool, 2)),
+                         [1, 2, 3])
+
+    def test_backpressure(self):
+        """Don't read ahead of the consumer by more than max_in_flight"""
+        pulled = []
+        def items():
+            for i in range(100):
+                pulled.append(i)
+                yield i
+        results = bounded_imap(abs, items(), self.pool, 3)
+        self.assertEqual(results.next(), 0)
+        self.failUnless(len(pulled) <= 4)
+
+class TagStreamTest(TestCase):
+    def test_tag_stream(self):
+        """Tag a stream of sentences with a thread pool"""
+        sentences = [["no", "timexes", "here"], ["nor", "here"]]
+        self.assertEqual(list(tag_stream(iter(sentences), processes=2,
+                                         threads=True)),
+                         sentences)
+
+class PipelineTest(TestCase):
+    def pipeline(self, processes=False):
+        return Pipeline([("double", lambda x: 2 * x),
+                         ("negate", lambda x: -x)], 2, processes)
+
+    def test_threads(self):
+        """Run each stage of a pipeline in its own thread"""
+        pipeline = self.pipeline()
+        self.assertEqual(list(pipeline.run(range(20))),
+                         [-2 * x for x in range(20)])
+        stats = pipeline.stats()
+        self.assertEqual([row["stage"] for row in stats],
+                         ["double", "negate"])
+        self.assertEqual([row["items"] for row in stats], [20, 20])
+        self.assertEqual([row["queue"] for row in stats], [0, 0])
+
+    def test_processes(self):
+        """Run each stage of a pipeline in its own process"""
+        pipeline = self.pipeline(True)
+        self.assertEqual(list(pipeline.run(range(20))),
+                         [-2 * x for x in range(20)])
+        self.assertEqual([row["items"] for row in pipeline.stats()],
+                         [20, 20])
+
+    def test_backpressure(self):
+        """Don't read ahead of a slow consumer by more than the queues hold"""
+        pulled = []
+        def items():
+            for i in range(100):
+                pulled.append(i)
+                yield i
+        results = self.pipeline().run(items())
+        self.assertEqual(results.next(), 0)
+        time.sleep(0.2)
+        self.failUnless(len(pulled) <= 3 * (2 + 1) + 2)
+        results.close()
+
+    def test_error(self):
+        """Report the failure of a stage"""
+        pipeline = Pipeline([("invert", lambda x: 1.0 / x)])
+        self.assertRaises(PipelineError, list, pipeline.run([1, 0, 2]))
+
+    def test_input_error(self):
+        """Report the failure of the input iterator"""
+        def items():
+            yield 1
+            yield 2
+            raise IOError("can't read item 3")
+        for processes in (False, True):
+            pipeline = Pipeline([("double", lambda x: 2 * x)],
+                                processes=processes)
+            results = pipeline.run(items())
+            self.assertEqual([results.next(), results.next()], [2, 4])
+            try:
+                results.next()
+            except PipelineError as e:
+                self.failUnless("input failed" in str(e))
+                self.failUnless("can't read item 3" in str(e))
+            else:
+                self.fail("expected PipelineError")
+
+def suite():
+    return TestSuite([TestLoader().loadTestsFromTestCase(cls) \
+                          for cls in (BoundedImapTest, TagStreamTest,
+                                      PipelineTest)])
+
+def run(runner=TextTestRunner, **args):
+    return runner(**args).run(suite())
+
+if __name__ == "__main__":
+    run(verbosity=2)
@@ -0,0 +1,285 @@
+import copy
+import itertools
+import os
+import pickle
+import shutil
+import tempfile
+from unittest import *
+
+import timex
+from timex import *
+
+temporal_functions = [value for value in vars(timex).values()
+                      if isinstance(value, type) and
+                         issubclass(value, TemporalFunction)]
+
+class TemporalFunctionTest(TestCase):
+    def arguments(self, cls):
+        """Return the required and optional arguments for constructing an
+        instance of cls, as lists of (name, value) pairs."""
+        names, defaults = cls.signature()
+        required = [(name, "%s-%s" % (cls.__name__, name))
+                    for name in names if name not in defaults]
+        optional = [(name, UtteranceTime())
+                    for name in names if name in defaults]
+        return required, optional
+
+    def test_construct(self):
+        """Construct temporal functions with and without optional arguments"""
+        for cls in temporal_functions:
+            required, optional = self.arguments(cls)
+            values = [value for name, value in required]
+            x = cls(*values)
+            self.assertEqual(x.args, tuple(values))
+            self.failUnless(cls(*values) is x)
+            self.failUnless(cls(**dict(required)) is x)
+            self.failUnless(cls(*(values + [None] * len(optional))) is x)
+            if optional:
+                y = cls(*(values + [value for name, value in optional]))
+                self.failIf(y is x)
+                self.failUnless(cls(**dict(required + optional)) is y)
+                self.assertEqual(len(y.args), len(required) + len(optional))
+
+    def test_none_without_default(self):
+        """Keep None arguments that have no default"""
+        self.assertEqual(Mod("APPROX", None).args, ("APPROX", None))
+        self.assertEqual(CoercedTimePoint("x", None).args, ("x", None))
+        self.assertEqual(BeginAnchoredTimex("x", "t1", None).args,
+                         ("x", "t1", None))
+
+    def test_bad_arguments(self):
+        """Report arguments that don't fit the constructor"""
+        self.assertRaises(TypeError, Increment)
+        self.assertRaises(TypeError, Increment, "unit", foo=1)
+        self.assertRaises(TypeError, Increment, "unit", unit="unit")
+
+    def test_immutable(self):
+        """Refuse to modify a temporal function"""
+        x = Increment("unit")
+        self.assertRaises(AttributeError, setattr, x, "unit", "other")
+        self.failUnless(copy.deepcopy(x) is x)
+        self.failUnless(pickle.loads(pickle.dumps(x, 2)) is x)
+
+class TerminalTest(TestCase):
+    def test_str(self):
+        """Print the terminals of the timex grammar"""
+        self.assertEqual(str(GreaterThan(1799)), "GreaterThan(1799)")
+        self.assertEqual(str(Other()), "Other()")
+        self.assertEqual(str(Any()), "Any()")
+
+class TimexGrammarHandleTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "timex-grammar.txt")
+        shutil.copy("timex-grammar.txt", self.filename)
+        self.handle = TimexGrammarHandle(self.filename, "timex", vars(timex))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def others(self, grammar):
+        return [symbol for rule in grammar.rules if rule
+                for symbol in rule.rhs if isinstance(symbol, Other)]
+
+    def test_reload_literals(self):
+        """Update the literals when the grammar is reloaded"""
+        old = self.handle.grammar
+        self.failIf("fortnightly" in self.handle.literals)
+        with open(self.filename, "a") as f:
+            f.write('\ntimex -> "fortnightly" { UtteranceTime() }\n')
+        self.handle.reload()
+        self.failUnless("fortnightly" in self.handle.literals)
+        self.assertEqual([str(x) for x in timex.parse(["fortnightly"],
+                                                      self.handle)],
+                         ["UtteranceTime()"])
+        new = self.handle.grammar
+        self.failUnless(new.literals is self.handle.literals)
+        self.failUnless(self.others(new))
+        for other in self.others(new):
+            self.failUnless(other.match("Fortnightly"))
+        # The grammar that was replaced keeps its own literals, as does
+        # the module's grammar.
+        self.failIf("fortnightly" in old.literals)
+        for grammar in (old, timex.timex_grammar.grammar):
+            for other in self.others(grammar):
+                self.failIf(other.match("fortnightly"))
+                self.failUnless(other.match("week"))
+
+    def test_unbound(self):
+        """Match nothing with an Other outside a loaded grammar"""
+        self.failIf(Other().match("week"))
+        grammar = read_timex_grammar(self.filename)
+        self.assertEqual(grammar.literals, self.handle.literals)
+        self.failUnless(self.others(grammar)[0].match("week"))
+
+class SpansTest(TestCase):
+    def test_offsets(self):
+        """Compute character offsets for space-separated tokens"""
+        self.assertEqual(token_offsets(["a", "bc", "d"]),
+                         [(0, 1), (2, 4), (5, 6)])
+        self.assertEqual(token_offsets([]), [])
+
+    def test_offsets_in_text(self):
+        """Find the tokens in the text they were taken from"""
+        text = "  On  Monday,\nthe"
+        self.assertEqual(token_offsets(["On", "Monday", ",", "the"], text),
+                         [(2, 4), (6, 12), (12, 13), (14, 17)])
+        self.assertRaises(ValueError, token_offsets, ["Tuesday"], text)
+
+    def test_repeated_tokens(self):
+        """Find repeated tokens in order"""
+        text = "the the  the"
+        self.assertEqual(token_offsets(["the"] * 3, text),
+                         [(0, 3), (4, 7), (9, 12)])
+        self.assertRaises(ValueError, token_offsets, ["the"] * 4, text)
+
+    def test_spans(self):
+        """Yield stand-off records for the timexes in a sentence"""
+        text = "He left  April 29th 2000 and came back today ."
+        tokens = text.split()
+        records = list(spans(tokens, text=text))
+        self.assertEqual([record[:4] for record in records],
+                         [(2, 5, 9, 24), (8, 9, 39, 44)])
+        self.assertEqual([text[start:end] for _, _, start, end, _ in records],
+                         ["April 29th 2000", "today"])
+        self.assertEqual([str(record[4]) for record in records],
+                         [str(x) for x in parse(tokens)
+                          if not isinstance(x, basestring)])
+
+    def test_spans_at_edges(self):
+        """Find timexes at the start and end of a sentence"""
+        tokens = ["today", "and", "yesterday"]
+        self.assertEqual([record[:4] for record in spans(tokens)],
+                         [(0, 1, 0, 5), (2, 3, 10, 19)])
+        self.assertEqual(list(spans(["no", "timexes"])), [])
+
+# The if/elif implementations that the dispatch tables replaced, as the
+# reference for their results.
+
+def reference_anchor_type(timex):
+    if isinstance(timex, Anchor): return type(timex)
+    elif isinstance(timex, TemporalModifier):
+        return reference_anchor_type(timex.timex)
+    elif isinstance(timex, TemporalFunction):
+        try:
+            return reference_anchor_type(timex.anchor)
+        except AttributeError:
+            pass
+
+def reference_timex_type(timex):
+    if isinstance(timex, TemporalModifier):
+        return reference_timex_type(timex.timex)
+    else: return type(timex)
+
+def reference_granularity(timex):
+    if not timex: return None
+    elif timex.__module__ == 'iso8601.iso8601':
+        cls = None
+        if isinstance(timex, Duration):
+            for unit in timex.elements[::-1]:
+                if unit.value:
+                    cls = type(unit)
+                    break
+        else:
+            cls = type(timex)
+        if not cls: return 'Undefined'
+        for timex_type in [Day, Year, Month, Quarter, Week, Hour, Minute,
+                           Second, Date]:
+            if issubclass(cls, timex_type): return timex_type.__name__
+        return 'Undefined'
+    elif isinstance(timex, (AnchoredTimex,
+                            TemporalModifier)):
+        return reference_granularity(timex.timex)
+    elif isinstance(timex, (AnchoredInterval,
+                            AnchoredTimePoint)):
+        return reference_granularity(timex.duration)
+    elif isinstance(timex, (GenericPlural,
+                            IncrementOrDecrement,
+                            CoercedTimePoint)):
+        return reference_granularity(timex.unit)
+    elif isinstance(timex, NextOrLastInstance):
+        return reference_granularity(timex.timepoint)
+
+class LastFortnight(Decrement): pass
+
+class DispatchTest(TestCase):
+    phrases = ["two weeks", "April 29th 2000", "Monday", "1999", "weeks",
+               "last week", "about two weeks", "the past 18 months",
+               "a month later", "next Monday"]
+
+    def setUp(self):
+        self.values = [x for phrase in self.phrases
+                       for x in parse(phrase.split())] + [Week, Month, None]
+        self.anchors = [None, UtteranceTime(), ReferenceTime(),
+                        Decrement(Week)(UtteranceTime())]
+
+    def candidates(self, name):
+        """Return some values for a constructor argument."""
+        if name == "anchor":
+            return self.anchors
+        elif name in ("modifier", "tid", "anchor_tid"):
+            return ["APPROX"]
+        return self.values
+
+    def instances(self):
+        for cls in temporal_functions + [LastFortnight]:
+            names, defaults = cls.signature()
+            for args in itertools.product(*map(self.candidates, names)):
+                yield cls(*args)
+
+    def assertSame(self, function, reference, timex):
+        def call(f):
+            try:
+                return f(timex)
+            except Exception as e:
+                return type(e)
+        self.assertEqual(call(function), call(reference),
+                         "%s differs on %r" % (function.__name__, timex))
+
+    def test_temporal_functions(self):
+        """Dispatch every temporal function as the if/elif tests did"""
+        timexes = list(self.instances())
+        for timex in timexes + [Mod("APPROX", x) for x in timexes]:
+            self.assertSame(anchor_type, reference_anchor_type, timex)
+            self.assertSame(timex_type, reference_timex_type, timex)
+            self.assertSame(granularity, reference_granularity, timex)
+
+    def test_other_values(self):
+        """Dispatch time units, classes and plain values"""
+        for value in self.values + ["token", 3]:
+            self.assertSame(anchor_type, reference_anchor_type, value)
+            self.assertSame(timex_type, reference_timex_type, value)
+        for value in self.values:
+            self.assertSame(granularity, reference_granularity, value)
+        # The if/elif version failed on values without a module.
+        self.assertEqual(granularity("token"), None)
+
+    def test_subclass(self):
+        """Look up the handlers for a new subclass through the cache"""
+        decrement = Decrement(Weeks, ReferenceTime())
+        fortnight = LastFortnight(Weeks, ReferenceTime())
+        for function, handlers in ((anchor_type, anchor_type_handlers),
+                                   (timex_type, timex_type_handlers),
+                                   (granularity, granularity_handlers)):
+            function(decrement)
+            self.failUnless(Decrement in handlers)
+            handlers.pop(LastFortnight, None)
+            self.assertEqual(function(fortnight),
+                             LastFortnight if function is timex_type
+                             else function(decrement))
+            self.failUnless(LastFortnight in handlers)
+        self.assertEqual(anchor_type(fortnight), ReferenceTime)
+
+def suite():
+    return TestSuite([TestLoader().loadTestsFromTestCase(cls) \
+                          for cls in (TemporalFunctionTest,
+                                      TerminalTest,
+                                      TimexGrammarHandleTest,
+                                      SpansTest,
+                                      DispatchTest)])
+
+def run(runner=TextTestRunner, **args):
+    return runner(**args).run(suite())
+
+if __name__ == "__main__":
+    run(verbosity=2)
@@ -0,0 +1,65 @@
+import marshal
+from decimal import Decimal
+from unittest import *
+
+from resolve import structure
+from timex import parse, Decrement, Mod, UtteranceTime, Week
+from wire import *
+
+class RoundTripTest(TestCase):
+    def assertRoundTrip(self, value):
+        for copy in (unpack(pack(value)), decode(encode(value))):
+            self.assertEqual(type(copy), type(value))
+            self.assertEqual(structure(copy), structure(value))
+
+    def test_plain(self):
+        """Round-trip strings, numbers, booleans and None"""
+        for value in ("token", u"t\xf6ken", "", 0, -3, 2**70, 1.5, True,
+                      False, None):
+            self.assertEqual(pack(value), value)
+            self.assertRoundTrip(value)
+
+    def test_containers(self):
+        """Round-trip decimals, lists, tuples and classes"""
+        for value in (Decimal("1.50"), [], ["a", 1, [2, None]], (),
+                      ("a", (1, 2.0), [3]), Week, UtteranceTime):
+            self.assertRoundTrip(value)
+        self.assertEqual(str(decode(encode(Decimal("1.50")))), "1.50")
+
+    def test_timexes(self):
+        """Round-trip parsed sentences, with time units and TimeReps"""
+        for phrase in ("He left April 29th 2000 .", "1999", "Monday",
+                       "two weeks ago", "about two weeks",
+                       "the past 18 months", "last week", "weeks"):
+            self.assertRoundTrip(list(parse(phrase.split())))
+
+    def test_interned(self):
+        """Decode temporal functions to the interned instances"""
+        last_week = Decrement(Week)(UtteranceTime())
+        about = Mod("APPROX", last_week)
+        for value in (last_week, about, UtteranceTime()):
+            self.failUnless(unpack(pack(value)) is value)
+            self.failUnless(decode(encode(value)) is value)
+        [copy] = decode(encode([about]))
+        self.failUnless(copy is about and copy.timex is last_week)
+
+    def test_version(self):
+        """Refuse to decode another version of the format"""
+        data = marshal.dumps((VERSION + 1, pack(["a", Week])), 2)
+        self.assertRaises(ValueError, decode, data)
+        self.assertEqual(decode(marshal.dumps((VERSION, pack(["a"])), 2)),
+                         ["a"])
+
+    def test_unknown(self):
+        """Refuse to encode objects of unknown classes"""
+        self.assertRaises(TypeError, pack, object())
+        self.assertRaises(ValueError, unpack, (99, "x"))
+
+def suite():
+    return TestSuite([TestLoader().loadTestsFromTestCase(RoundTripTest)])
+
+def run(runner=TextTestRunner, **args):
+    return runner(**args).run(suite())
+
+if __name__ == "__main__":
+    run(verbosity=2)
@@ -1,10 +1,14 @@
 from decimal import Decimal
 import re
-import codecs
+import inspect
+import time
+from itertools import islice
+from StringIO import StringIO
+from weakref import WeakValueDictionary
 
 from cfg import *
-from earley import Parser
-from grammarparser import parse_grammar_spec
+from earley import Parser, State
+from grammarparser import GrammarHandle, load_grammar_spec
 from iso8601 import *
 
 # Terminals for the timex grammar.
@@ -63,6 +67,8 @@ class HHMMSSToken(RegexpTerminal):
 class Any(Terminal):
     def match(self, token): return True
 
+    def __str__(self): return "Any()"
+
 class GreaterThan(Terminal):
     def __init__(self, lower_bound):
         self.lower_bound = lower_bound
@@ -73,6 +79,9 @@ class GreaterThan(Terminal):
         except Exception:
             return False
 
+    def __str__(self):
+        return "GreaterThan(%s)" % self.lower_bound
+
 class Exact(Terminal):
     """i.e. preserving case when checking for a match."""
     def __init__(self, lit):
@@ -82,25 +91,134 @@ class Exact(Terminal):
         if not isinstance(token, basestring): return False
         return token and self.lit == unicode(token)
 
-f = codecs.open('timex-grammar.txt', mode='r', encoding='UTF-8')
-raw = f.read()
-f.close()
-literals = set([lit[2:-2] for lit in re.findall(r'\s\"[A-Za-z]*?\"\s', raw)])
+    def __str__(self):
+        return self.lit
+
+def find_literals(spec):
+    """Return the set of alphabetic literals in the text of a grammar
+    specification."""
+    return set([lit[2:-2]
+                for lit in re.findall(r'\s\"[A-Za-z]*?\"\s', spec)])
 
 class Other(Terminal):
-    """Matches strings NOT found in the grammar."""
-    def __init__(self): pass
+    """Matches strings NOT found in the grammar. The literals of the grammar
+    are given to its Other terminals when it's loaded (see
+    bind_literals); until then, nothing matches."""
+    def __init__(self):
+        self.literals = frozenset()
 
     def match(self, token):
-        return token.lower() in literals
+        return token.lower() in self.literals
+
+    def __str__(self): return "Other()"
 
 # Temporal functions.
-            
+
+# Live temporal functions, keyed on their class and constructor arguments.
+interned = WeakValueDictionary()
+
+class Interned(type):
+    """A metaclass for immutable classes whose instances are interned:
+    constructing an instance with the same arguments (of the same types) as
+    a live one returns that one. Arguments are matched against the
+    signature of __init__, with defaults filled in, so positional and
+    keyword constructions are interned alike; trailing arguments whose
+    value is None and whose declared default is None are dropped. Instances
+    whose arguments aren't hashable are not interned, but are still
+    immutable."""
+
+    signatures = {} # (parameter names, defaults), keyed on class
+
+    def signature(cls):
+        try:
+            return Interned.signatures[cls]
+        except KeyError:
+            pass
+        init = cls.__init__
+        if inspect.ismethod(init):
+            spec = inspect.getargspec(init)
+            if spec.varargs or spec.keywords:
+                signature = None
+            else:
+                names = spec.args[1:]
+                defaults = spec.defaults or ()
+                signature = (names,
+                             dict(zip(names[len(names)-len(defaults):],
+                                      defaults)))
+        else:
+            signature = ([], {}) # object.__init__
+        Interned.signatures[cls] = signature
+        return signature
+
+    def bind(cls, args, kwargs):
+        """Return the normalized arguments of a construction, as a tuple
+        of values in the order of the parameters of __init__, or None if
+        they don't fit its signature."""
+        signature = cls.signature()
+        if signature is None:
+            return None if kwargs else args
+        names, defaults = signature
+        if len(args) > len(names):
+            return None
+        values = list(args)
+        for name in names[len(args):]:
+            if name in kwargs:
+                values.append(kwargs[name])
+            elif name in defaults:
+                values.append(defaults[name])
+            else:
+                return None
+        if any(name not in names[len(args):] for name in kwargs):
+            return None
+        while values and values[-1] is None and \
+              defaults.get(names[len(values)-1], 0) is None:
+            values.pop()
+        return tuple(values)
+
+    def __call__(cls, *args, **kwargs):
+        bound = cls.bind(args, kwargs)
+        if bound is None:
+            # Let __init__ report the mismatch.
+            return super(Interned, cls).__call__(*args, **kwargs)
+        try:
+            key = (cls,) + tuple((type(arg), arg) for arg in bound)
+            return interned[key]
+        except KeyError:
+            pass
+        except TypeError:
+            key = None
+        instance = super(Interned, cls).__call__(*args, **kwargs)
+        instance.__dict__["args"] = bound # and now it's immutable
+        if key:
+            interned[key] = instance
+        return instance
+
 class TemporalFunction(object):
+    """The base class of temporal functions. Temporal functions are
+    immutable, and equal ones are usually identical (see Interned), so they
+    may be shared and used as dictionary keys; anchoring one returns a new
+    one. Their constructor arguments are available as args."""
+
+    __metaclass__ = Interned
+
     def __call__(self, anchor):
         raise ValueError("Not yet implemented for %s" %
                          self.__class__.__name__)
 
+    def __setattr__(self, name, value):
+        if "args" in self.__dict__:
+            raise AttributeError("%s is immutable" % type(self).__name__)
+        super(TemporalFunction, self).__setattr__(name, value)
+
+    def __reduce__(self):
+        return (type(self), self.args)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
     def __str__(self):
         return "%s()" % self.__class__.__name__
 
@@ -136,12 +254,11 @@ class ReferenceTime(Anchor): pass
 
 class AnchoredInterval(TemporalFunction):
     def __call__(self, anchor):
-        self.anchor = anchor
-        return self
-        
-    def __init__(self, duration):
+        return type(self)(self.duration, anchor)
+
+    def __init__(self, duration, anchor=None):
         self.duration = duration
-        self.anchor = None
+        self.anchor = anchor
 
     def __str__(self):
         if self.anchor:
@@ -157,12 +274,11 @@ class PastAnchoredInterval(AnchoredInterval, PastRef): pass
 class FutureAnchoredInterval(AnchoredInterval, FutureRef): pass
 
 class IndefReference(TemporalFunction):
-    def __init__(self):
-        self.anchor = None
+    def __init__(self, anchor=None):
+        self.anchor = anchor
 
     def __call__(self, anchor):
-        self.anchor = anchor
-        return self
+        return type(self)(anchor)
 
 class IndefPast(IndefReference, PastRef): pass
 
@@ -179,15 +295,13 @@ class GenericPlural(TemporalFunction):
 
 class AnchoredTimePoint(TemporalFunction):
     def __call__(self, anchor):
-        if not (self.anchor and isinstance(self.anchor, TemporalFunction)):
-            self.anchor = anchor
-        else:
-            self.anchor = self.anchor(anchor) 
-        return self
-    
-    def __init__(self, duration):
+        if self.anchor and isinstance(self.anchor, TemporalFunction):
+            anchor = self.anchor(anchor)
+        return type(self)(self.duration, anchor)
+
+    def __init__(self, duration, anchor=None):
         self.duration = duration
-        self.anchor = None
+        self.anchor = anchor
 
     def __str__(self):
         if self.anchor:
@@ -204,15 +318,13 @@ class FutureAnchoredTimePoint(AnchoredTimePoint, FutureRef): pass
 
 class IncrementOrDecrement(TemporalFunction):
     def __call__(self, anchor):
-        if not (self.anchor and isinstance(self.anchor, TemporalFunction)):
-            self.anchor = anchor
-        else:
-            self.anchor = self.anchor(anchor) 
-        return self
-    
-    def __init__(self, unit):
+        if self.anchor and isinstance(self.anchor, TemporalFunction):
+            anchor = self.anchor(anchor)
+        return type(self)(self.unit, anchor)
+
+    def __init__(self, unit, anchor=None):
         self.unit = unit
-        self.anchor = None
+        self.anchor = anchor
 
     def __str__(self):
         if self.anchor:
@@ -229,15 +341,13 @@ class Increment(IncrementOrDecrement, FutureRef): pass
 
 class NextOrLastInstance(TemporalFunction):
     def __call__(self, anchor):
-        if not (self.anchor and isinstance(self.anchor, TemporalFunction)):
-            self.anchor = anchor
-        else:
-            self.anchor = self.anchor(anchor) 
-        return self
-    
-    def __init__(self, timepoint):
+        if self.anchor and isinstance(self.anchor, TemporalFunction):
+            anchor = self.anchor(anchor)
+        return type(self)(self.timepoint, anchor)
+
+    def __init__(self, timepoint, anchor=None):
         self.timepoint = timepoint
-        self.anchor = None
+        self.anchor = anchor
 
     def __str__(self):
         if self.anchor:
@@ -289,9 +399,22 @@ class DoNotParse(object):
         for x in self.dontparse:
             yield x
 
+def bind_literals(grammar, literals):
+    """Record the literals of a grammar on it, and give them to its Other
+    terminals. Returns the grammar."""
+    grammar.literals = literals
+    for rule in grammar.rules:
+        for symbol in rule.rhs if rule else ():
+            if isinstance(symbol, Other):
+                symbol.literals = literals
+    return grammar
+
 def read_timex_grammar(filename="timex-grammar.txt"):
     with open(filename) as f:
-        return parse_grammar_spec(f.readline, "timex", globals())
+        spec = f.read()
+    return bind_literals(load_grammar_spec(StringIO(spec).readline, "timex",
+                                           globals(), filename=filename),
+                         find_literals(spec))
 
 def normalize_space(s):
     """Replace all runs of whitespace with a single space."""
@@ -343,91 +466,276 @@ def sentences(s):
     if i < n and i < j:
         yield s[i:j]
 
-def parse(tokens, grammar=read_timex_grammar()):
+def evaluate(parser, tree, stats=None):
+    """Evaluate a parse tree, or a complete parser state without building
+    its tree (see Parser.evaluate), recording the time taken in stats (if
+    given) under eval_time."""
+    if isinstance(tree, State):
+        evaluator = parser.evaluate
+    else:
+        evaluator = parser.grammar.eval
+    if stats is None:
+        return evaluator(tree)
+    start = time.time()
+    value = evaluator(tree)
+    stats["eval_time"] = stats.get("eval_time", 0) + time.time() - start
+    stats["evals"] = stats.get("evals", 0) + 1
+    return value
+
+def parse_first(parser, tokens, fused=False, stats=None, score=None,
+                deadline=None, max_states=None):
+    """Parse the longest timex at the start of the tokens, and return the
+    number of tokens it spans and its value. Raises StopIteration if there
+    is none. If fused is true, the value is computed directly from the
+    parser's states, without building a parse tree. If a score function is
+    given (see earley.longest_span), the best parse by that score is taken
+    instead of the longest. The deadline and maximum number of states are
+    passed on to the parser; if the parse runs out of either, only the
+    timexes that end before that point are considered. If the deadline has
+    already passed, the tokens aren't parsed at all, and the position is
+    counted in stats under "skipped"."""
+    if deadline is not None and time.time() > deadline:
+        if stats is not None:
+            stats["skipped"] = stats.get("skipped", 0) + 1
+        raise StopIteration
+    parser.parse(tokens, stats, deadline, max_states)
+    if score:
+        n, state = parser.best_states(1, score).next()
+    else:
+        n, state = parser.final_states().next()
+    if fused:
+        return n, evaluate(parser, state, stats)
+    return n, evaluate(parser, state.parse_tree(end=n), stats)
+
+class TimexGrammarHandle(GrammarHandle):
+    """A grammar handle that also finds the literals of the specification,
+    for Other. They are kept with the grammar they were read with, so a
+    reload swaps both at once."""
+
+    def load(self, spec):
+        return bind_literals(super(TimexGrammarHandle, self).load(spec),
+                             find_literals(spec))
+
+    @property
+    def literals(self):
+        return self.grammar.literals
+
+# The timex grammar, which may be reloaded while the process is running
+# (see GrammarHandle).
+timex_grammar = TimexGrammarHandle("timex-grammar.txt", "timex", globals())
+
+def make_parser(grammar, tables=None, max_time=None, max_span=None):
+    """Return a parser for a sentence, the deadline for parsing it and the
+    width of the span window (or None), as a triple; the arguments are as
+    for parse."""
+    if isinstance(grammar, GrammarHandle):
+        grammar, handle_tables = grammar.get()
+        tables = tables or handle_tables
+    deadline = time.time() + max_time if max_time is not None else None
+    if max_span == "auto":
+        max_span = grammar.longest_yield()
+    return Parser(grammar, tables), deadline, max_span
+
+def parse(tokens, grammar=timex_grammar, tables=None, stats=None,
+          fused=False, score=None, max_time=None, max_states=None,
+          max_span=None):
+    """Yield the tokens of a sentence, with timexes replaced by their
+    values. If parse tables for the grammar are given, the parser uses
+    them; if the grammar is a GrammarHandle, its current grammar is used,
+    along with its tables unless others are given. If stats is a
+    dictionary, parser statistics (see Parser.parse) are accumulated in it.
+    If fused is true, timexes are evaluated without building parse trees;
+    if a score function is given, it chooses among ambiguous parses (see
+    parse_first). Leo's optimization (see earley.Parser) isn't offered
+    here: the timex grammar is ambiguous, and with it, the parser finds
+    the parses in a different order, so another parse may be chosen.
+
+    A budget may be set for the sentence: at most max_time seconds in all,
+    and at most max_states chart states for each parse. A parse that runs
+    out of either stops early, and only the timexes that end before that
+    point are found; each such parse is counted in stats under
+    "truncated". Once the time is up, the rest of the sentence is passed
+    through untagged (see parse_first).
+
+    If max_span is given, the parser only sees that many tokens at each
+    position, so no timex is longer than that, and the cost of a sentence
+    is linear in its length. If it is "auto", the window is the longest
+    span the grammar can derive without recursion (see
+    cfg.Grammar.longest_yield)."""
+    parser, deadline, max_span = make_parser(grammar, tables, max_time,
+                                             max_span)
     tokens = list(tokens)
-    parser = Parser(grammar)
     while tokens:
-        parser.parse(tokens)
         try:
-            tree = parser.parses().next()
-            next_parse = parser.grammar.eval(tree)
-            if isinstance(next_parse, DoNotParse):
-                for p in next_parse():
-                    yield p
-            else:
-                yield next_parse
-            del tokens[0:len(list(tree.leaves()))]
+            n, next_parse = parse_first(parser, islice(tokens, max_span),
+                                        fused, stats, score, deadline,
+                                        max_states)
         except StopIteration:
             yield tokens.pop(0)
+            continue
+        if isinstance(next_parse, DoNotParse):
+            for p in next_parse():
+                yield p
+        else:
+            yield next_parse
+        del tokens[0:n]
 
-def parse2(tokens, grammar=read_timex_grammar()):
+def parse2(tokens, grammar=timex_grammar, tables=None, stats=None,
+           fused=False, score=None, max_time=None, max_states=None,
+           max_span=None):
     """Another parse function, but now one that in addition to the token or parse
     also returns how many tokens were consumed."""
+    parser, deadline, max_span = make_parser(grammar, tables, max_time,
+                                             max_span)
     tokens = list(tokens)
-    parser = Parser(grammar)
     while tokens:
-        parser.parse(tokens)
         try:
-            tree = parser.parses().next()
-            next_parse = parser.grammar.eval(tree)
-            if isinstance(next_parse, DoNotParse):
-                # not sure whether this is used, but leave a warning just in case
-                print "WARNING: we have a DoNotParse"
-                for p in next_parse():
-                    yield p
-            else:
-                yield (len(list(tree.leaves())), next_parse)
-            del tokens[0:len(list(tree.leaves()))]
+            n, next_parse = parse_first(parser, islice(tokens, max_span),
+                                        fused, stats, score, deadline,
+                                        max_states)
         except StopIteration:
             yield (1, tokens.pop(0))
+            continue
+        if isinstance(next_parse, DoNotParse):
+            for p in next_parse():
+                yield (1, p)
+        else:
+            yield (n, next_parse)
+        del tokens[0:n]
+
+def token_offsets(tokens, text=None):
+    """Return a list of (start, end) character offsets for the tokens. If
+    the text they were taken from is given, each token is looked up in it,
+    in order; otherwise, they are assumed to be separated by single
+    spaces."""
+    offsets = []
+    i = 0
+    for token in tokens:
+        if text is not None:
+            i = text.find(token, i)
+            if i < 0:
+                raise ValueError("token %r not found in text" % token)
+        offsets.append((i, i + len(token)))
+        i += len(token) if text is not None else len(token) + 1
+    return offsets
+
+def spans(tokens, grammar=timex_grammar, tables=None, stats=None,
+          fused=False, score=None, max_time=None, max_states=None,
+          max_span=None, text=None):
+    """Yield stand-off records for the timexes in a sentence: tuples of the
+    form (start_token, end_token, start_char, end_char, value), where the
+    end offsets are exclusive. Other tokens are skipped. Character offsets
+    are computed as in token_offsets; the remaining arguments are as for
+    parse."""
+    parser, deadline, max_span = make_parser(grammar, tables, max_time,
+                                             max_span)
+    tokens = list(tokens)
+    offsets = token_offsets(tokens, text)
+    i = 0
+    while i < len(tokens):
+        try:
+            end = i + max_span if max_span is not None else None
+            n, value = parse_first(parser, tokens[i:end], fused,
+                                   stats, score, deadline, max_states)
+        except StopIteration:
+            i += 1
+            continue
+        if not isinstance(value, DoNotParse):
+            yield (i, i + n, offsets[i][0], offsets[i + n - 1][1], value)
+        i += n
 
 def anchored(timex):
     return timex['anchorTimeID'] or timex['beginPoint'] or timex['endPoint']
 
+class TypeDispatch(dict):
+    """A table of handlers keyed on type. The handler for a type is chosen
+    by calling choose with the type the first time it's looked up, and
+    cached thereafter, so that the isinstance tests are paid once per type
+    rather than once per call."""
+
+    def __init__(self, choose):
+        self.choose = choose
+
+    def __missing__(self, cls):
+        handler = self[cls] = self.choose(cls)
+        return handler
+
+def return_none(x):
+    return None
+
+def anchor_type_handler(cls):
+    if issubclass(cls, Anchor): return type
+    elif issubclass(cls, TemporalModifier):
+        return lambda timex: anchor_type(timex.timex)
+    elif issubclass(cls, TemporalFunction):
+        def function_anchor_type(timex):
+            try:
+                return anchor_type(timex.anchor)
+            except AttributeError:
+                pass
+        return function_anchor_type
+    else: return return_none
+
+anchor_type_handlers = TypeDispatch(anchor_type_handler)
+
 def anchor_type(timex):
-    if isinstance(timex, Anchor): return type(timex)
-    elif isinstance(timex, TemporalModifier):
-        return anchor_type(timex.timex)
-    elif isinstance(timex, TemporalFunction):
-        try:
-            return anchor_type(timex.anchor)
-        except AttributeError:
-            pass
+    return anchor_type_handlers[type(timex)](timex)
 
 def anchoring_type(timex):
     if timex['anchorTimeID']: return 'ANCHOR'
     elif timex['beginPoint']: return 'BEGIN'
     elif timex['endPoint']: return 'END'
 
+def timex_type_handler(cls):
+    if issubclass(cls, TemporalModifier):
+        return lambda timex: timex_type(timex.timex)
+    else: return type
+
+timex_type_handlers = TypeDispatch(timex_type_handler)
+
 def timex_type(timex):
-    if isinstance(timex, TemporalModifier): return timex_type(timex.timex)
-    else: return type(timex)
+    return timex_type_handlers[type(timex)](timex)
+
+granularity_units = [Day, Year, Month, Quarter, Week, Hour, Minute, Second,
+                     Date]
+
+def unit_granularity(cls):
+    for unit in granularity_units:
+        if issubclass(cls, unit): return unit.__name__
+    return 'Undefined'
+
+def duration_granularity(duration):
+    for unit in duration.elements[::-1]:
+        if unit.value:
+            return granularity_handlers[type(unit)](unit)
+    return 'Undefined'
+
+def granularity_handler(cls):
+    if cls.__module__ == 'iso8601.iso8601':
+        if issubclass(cls, Duration): return duration_granularity
+        else:
+            name = unit_granularity(cls)
+            return lambda timex: name
+    elif issubclass(cls, (AnchoredTimex,
+                          TemporalModifier)):
+        return lambda timex: granularity(timex.timex)
+    elif issubclass(cls, (AnchoredInterval,
+                          AnchoredTimePoint)):
+        return lambda timex: granularity(timex.duration)
+    elif issubclass(cls, (GenericPlural,
+                          IncrementOrDecrement,
+                          CoercedTimePoint)):
+        return lambda timex: granularity(timex.unit)
+    elif issubclass(cls, NextOrLastInstance):
+        return lambda timex: granularity(timex.timepoint)
+    else: return return_none
+
+granularity_handlers = TypeDispatch(granularity_handler)
 
 def granularity(timex):
     if not timex: return None
-    elif timex.__module__ == 'iso8601.iso8601':
-        cls = None
-        if isinstance(timex, Duration):
-            for unit in timex.elements[::-1]:
-                if unit.value:
-                    cls = type(unit)
-                    break
-        else:
-            cls = type(timex)
-        if not cls: return 'Undefined'
-        for timex_type in [Day, Year, Month, Quarter, Week, Hour, Minute,
-                           Second, Date]:
-            if issubclass(cls, timex_type): return timex_type.__name__
-        return 'Undefined'
-    elif isinstance(timex, (AnchoredTimex,
-                            TemporalModifier)):
-        return granularity(timex.timex)
-    elif isinstance(timex, (AnchoredInterval,
-                            AnchoredTimePoint)):
-        return granularity(timex.duration)
-    elif isinstance(timex, (GenericPlural,
-                            IncrementOrDecrement,
-                            CoercedTimePoint)):
-        return granularity(timex.unit)
-    elif isinstance(timex, NextOrLastInstance):
-        return granularity(timex.timepoint)
+    elif isinstance(timex, type):
+        # A class, e.g., the unit of a generic plural. Dispatching on its
+        # type (a metaclass) would lose its module, so it's not cached.
+        return 'Undefined' if timex.__module__ == 'iso8601.iso8601' else None
+    else: return granularity_handlers[type(timex)](timex)
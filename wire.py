@@ -0,0 +1,106 @@
+"""A compact serialization format for timex parse results.
+
+Pickling a tagged sentence writes out a deep graph of objects, with the
+full module and class name of every one. Here, values are instead encoded
+as nested tuples of built-in types, which are then written with marshal:
+
+    token (a string)      -> itself
+    number, None, bool    -> itself
+    Decimal               -> (DECIMAL, string)
+    list, tuple           -> (LIST or TUPLE, item, ...)
+    class (e.g., Week)    -> (CLASS, name)
+    temporal function     -> (FUNCTION, name, arg, ...)
+    other object          -> (OBJECT, name, attribute, value, ...)
+
+Temporal functions are rebuilt from their constructor arguments, so they
+are interned on decoding just as they were when they were parsed; other
+objects (iso8601 TimeReps and TimeUnits) have their attributes restored
+directly. Classes are identified by name, and must be defined in timex or
+iso8601. Class and attribute names are interned, so marshal writes each
+only once per message. Every message starts with the format version."""
+
+import marshal
+from decimal import Decimal
+
+import iso8601.iso8601
+import timex
+from timex import TemporalFunction
+
+VERSION = 1
+
+DECIMAL, LIST, TUPLE, CLASS, FUNCTION, OBJECT = range(6)
+
+def find_classes(*modules):
+    """Return a dictionary of the classes defined in the given modules,
+    keyed on name."""
+    return dict((value.__name__, value)
+                for module in modules
+                for value in vars(module).values()
+                if isinstance(value, type) and
+                   value.__module__ == module.__name__)
+
+classes = find_classes(iso8601.iso8601, timex)
+
+def name(cls):
+    if classes.get(cls.__name__) is not cls:
+        raise TypeError("can't encode an instance of %r" % cls)
+    return intern(cls.__name__)
+
+# Values of these types are written as they are.
+plain = frozenset([str, unicode, bool, int, long, float, type(None)])
+
+def pack(value):
+    if type(value) in plain:
+        return value
+    elif isinstance(value, list):
+        return (LIST,) + tuple([x if type(x) in plain else pack(x)
+                                for x in value])
+    elif isinstance(value, TemporalFunction):
+        return (FUNCTION, name(type(value))) + \
+            tuple([pack(x) for x in value.args])
+    elif isinstance(value, type):
+        return (CLASS, name(value))
+    elif isinstance(value, tuple):
+        return (TUPLE,) + tuple([pack(x) for x in value])
+    elif isinstance(value, Decimal):
+        return (DECIMAL, str(value))
+    else:
+        packed = [OBJECT, name(type(value))]
+        for attr, x in sorted(vars(value).items()):
+            packed.extend((intern(attr), pack(x)))
+        return tuple(packed)
+
+def unpack(packed):
+    if type(packed) is not tuple:
+        return packed
+    tag = packed[0]
+    if tag == LIST:
+        return [x if type(x) is not tuple else unpack(x)
+                for x in packed[1:]]
+    elif tag == FUNCTION:
+        return classes[packed[1]](*[unpack(x) for x in packed[2:]])
+    elif tag == CLASS:
+        return classes[packed[1]]
+    elif tag == OBJECT:
+        cls = classes[packed[1]]
+        value = cls.__new__(cls)
+        for i in range(2, len(packed), 2):
+            value.__dict__[packed[i]] = unpack(packed[i+1])
+        return value
+    elif tag == TUPLE:
+        return tuple([unpack(x) for x in packed[1:]])
+    elif tag == DECIMAL:
+        return Decimal(packed[1])
+    raise ValueError("invalid tag %r" % (tag,))
+
+def encode(value):
+    """Encode a value (e.g., a list of tokens and timexes, as returned by
+    timex.parse) as a string."""
+    return marshal.dumps((VERSION, pack(value)), 2)
+
+def decode(data):
+    """Decode a value encoded by encode."""
+    version, packed = marshal.loads(data)
+    if version != VERSION:
+        raise ValueError("unsupported wire format version %r" % (version,))
+    return unpack(packed)